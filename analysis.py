@@ -0,0 +1,166 @@
+"""
+One-pass media analysis with a cached JSON sidecar.
+
+A single ffmpeg decode computes scene changes (select+showinfo), silence
+intervals (silencedetect) and a momentary loudness envelope (ebur128);
+keyframe positions come from an ffprobe packet scan that does not decode.
+Results are cached per input so the concat effects can snap cut points to
+meaningful boundaries with a binary search instead of rerunning detection.
+"""
+import os
+import re
+import json
+import bisect
+import subprocess
+from dataclasses import dataclass, field, asdict
+from typing import List, Optional, Tuple
+
+import tracing
+from utils import cache_dir, file_cache_key
+
+ANALYSIS_VERSION = 1
+SCENE_THRESHOLD = 0.3
+SILENCE_NOISE = "-30dB"
+SILENCE_MIN_DURATION = 0.25
+
+_RE_SCENE = re.compile(r"Parsed_showinfo.*?pts_time:\s*(-?[0-9.]+)")
+_RE_SILENCE_START = re.compile(r"silence_start:\s*(-?[0-9.]+)")
+_RE_SILENCE_END = re.compile(r"silence_end:\s*(-?[0-9.]+)")
+_RE_LOUDNESS = re.compile(r"Parsed_ebur128.*?\bt:\s*([0-9.]+).*?\bM:\s*(-?[0-9.]+|-inf)")
+
+@dataclass
+class MediaAnalysis:
+    scenes: List[float] = field(default_factory=list)
+    keyframes: List[float] = field(default_factory=list)
+    silences: List[Tuple[float, float]] = field(default_factory=list)
+    loudness: List[Tuple[float, float]] = field(default_factory=list)
+    _cut_points: Optional[List[float]] = field(default=None, init=False, repr=False, compare=False)
+
+    def to_dict(self):
+        d = asdict(self)
+        del d["_cut_points"]
+        d["version"] = ANALYSIS_VERSION
+        return d
+
+    @staticmethod
+    def from_dict(d):
+        return MediaAnalysis(
+            scenes=list(d.get("scenes", [])),
+            keyframes=list(d.get("keyframes", [])),
+            silences=[tuple(s) for s in d.get("silences", [])],
+            loudness=[tuple(p) for p in d.get("loudness", [])],
+        )
+
+    def cut_points(self):
+        # Scene changes plus speech onsets (end of each silence), sorted
+        if self._cut_points is None:
+            self._cut_points = sorted(set(self.scenes) | {end for _, end in self.silences})
+        return self._cut_points
+
+    def snap(self, t, window=0.5, points=None, exclude=()):
+        # Nearest boundary within +/- window seconds (skipping `exclude`), else t unchanged
+        pts = self.cut_points() if points is None else points
+        if not pts:
+            return t
+        i = bisect.bisect_left(pts, t)
+        best = None
+        for j in (i - 1, i):
+            if 0 <= j < len(pts) and abs(pts[j] - t) <= window and pts[j] not in exclude:
+                if best is None or abs(pts[j] - t) < abs(best - t):
+                    best = pts[j]
+        return t if best is None else best
+
+    def snap_keyframe(self, t, window=1.0):
+        return self.snap(t, window=window, points=self.keyframes)
+
+    def remapped(self, video_map, audio_map=None):
+        # Times carried through a retiming filter chain; keyframes belong to the
+        # old encode and are dropped, audio data only survives with an audio map
+        out = MediaAnalysis(scenes=sorted(video_map(t) for t in self.scenes))
+        if audio_map is not None:
+            out.silences = sorted(tuple(sorted((audio_map(a), audio_map(b)))) for a, b in self.silences)
+            out.loudness = sorted((audio_map(t), v) for t, v in self.loudness)
+        return out
+
+def _parse_filter_log(stderr, analysis):
+    silence_start = None
+    for line in stderr.splitlines():
+        m = _RE_SCENE.search(line)
+        if m:
+            analysis.scenes.append(float(m.group(1)))
+            continue
+        m = _RE_SILENCE_START.search(line)
+        if m:
+            silence_start = max(0.0, float(m.group(1)))
+            continue
+        m = _RE_SILENCE_END.search(line)
+        if m and silence_start is not None:
+            analysis.silences.append((silence_start, float(m.group(1))))
+            silence_start = None
+            continue
+        m = _RE_LOUDNESS.search(line)
+        if m:
+            value = m.group(2)
+            analysis.loudness.append((float(m.group(1)), -120.0 if value == "-inf" else float(value)))
+
+def scan_keyframes(path, ffprobe):
+    cmd = [ffprobe, "-v", "error", "-select_streams", "v:0", "-show_entries", "packet=pts_time,flags", "-of", "csv=p=0", path]
+    out = tracing.run(cmd)
+    keys = []
+    for line in out.stdout.splitlines():
+        parts = line.strip().split(",")
+        if len(parts) >= 2 and "K" in parts[1]:
+            try:
+                keys.append(float(parts[0]))
+            except ValueError:
+                pass
+    return sorted(keys)
+
+def analyze_media(path, ffmpeg="ffmpeg", ffprobe="ffprobe"):
+    vf = f"scale=160:-2,select='gt(scene,{SCENE_THRESHOLD})',showinfo"
+    af = f"silencedetect=n={SILENCE_NOISE}:d={SILENCE_MIN_DURATION},ebur128"
+    cmd = [ffmpeg, "-hide_banner", "-nostats", "-i", path, "-vf", vf, "-af", af, "-f", "null", "-"]
+    try:
+        proc = tracing.run(cmd)
+    except subprocess.CalledProcessError as e:
+        raise RuntimeError(f"ffmpeg analysis failed (rc={e.returncode}):\n{e.stderr}") from e
+    analysis = MediaAnalysis()
+    _parse_filter_log(proc.stderr, analysis)
+    analysis.scenes.sort()
+    try:
+        analysis.keyframes = scan_keyframes(path, ffprobe)
+    except Exception:
+        analysis.keyframes = []
+    return analysis
+
+def sidecar_path(path, directory=None):
+    if directory is None:
+        directory = cache_dir("analysis")
+    return os.path.join(directory, file_cache_key(path) + ".json")
+
+def load_analysis(path, directory=None):
+    # Cached sidecar only; None if the input has not been analysed yet
+    sidecar = sidecar_path(path, directory)
+    try:
+        with open(sidecar, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        if data.get("version") != ANALYSIS_VERSION:
+            return None
+        return MediaAnalysis.from_dict(data)
+    except Exception:
+        return None
+
+def get_analysis(path, directory=None, ffmpeg="ffmpeg", ffprobe="ffprobe"):
+    cached = load_analysis(path, directory)
+    if cached is not None:
+        return cached
+    analysis = analyze_media(path, ffmpeg=ffmpeg, ffprobe=ffprobe)
+    save_analysis(path, analysis, directory)
+    return analysis
+
+def save_analysis(path, analysis, directory=None):
+    sidecar = sidecar_path(path, directory)
+    tmp = sidecar + ".part"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(analysis.to_dict(), f)
+    os.replace(tmp, sidecar)
@@ -0,0 +1,124 @@
+"""
+Cached ffmpeg capability detection.
+
+Reads the version, encoders, filters and hwaccels of the installed ffmpeg
+once and caches them on disk keyed by the binary's resolved path and mtime,
+so GUI start-up and headless workers do not spawn ffmpeg just to find out
+what it can do. The backend uses this to pick codecs and to validate effect
+filter chains before rendering.
+"""
+import os
+import re
+import json
+import shutil
+import hashlib
+import subprocess
+
+from utils import cache_dir
+
+CAPS_VERSION = 1
+
+# Preferred H.264-ish encoders first, then anything mp4 can carry
+VIDEO_ENCODERS = ("libx264", "libopenh264", "h264_nvenc", "h264_qsv", "h264_amf", "h264_videotoolbox", "mpeg4")
+AUDIO_ENCODERS = ("aac", "libfdk_aac", "libmp3lame")
+
+_RE_ENCODER = re.compile(r"^\s*([VAS][A-Z.]{5})\s+(\S+)")
+_RE_FILTER = re.compile(r"^\s*[A-Z.]{2,3}\s+(\w+)\s+[A-Z|N]+->[A-Z|N]+")
+
+_memo = {}
+
+def _run(cmd):
+    return subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, check=True).stdout
+
+def _parse_encoders(text):
+    encoders = {"video": [], "audio": [], "subtitle": []}
+    kinds = {"V": "video", "A": "audio", "S": "subtitle"}
+    seen_header = False
+    for line in text.splitlines():
+        if line.strip().startswith("------"):
+            seen_header = True
+            continue
+        m = _RE_ENCODER.match(line)
+        if seen_header and m:
+            encoders[kinds[m.group(1)[0]]].append(m.group(2))
+    return encoders
+
+def _parse_filters(text):
+    return sorted({m.group(1) for m in map(_RE_FILTER.match, text.splitlines()) if m})
+
+def _parse_hwaccels(text):
+    lines = text.splitlines()
+    for i, line in enumerate(lines):
+        if line.strip().lower().startswith("hardware acceleration methods"):
+            return [l.strip() for l in lines[i + 1:] if l.strip()]
+    return []
+
+def _detect(path):
+    version_line = _run([path, "-hide_banner", "-version"]).splitlines()[0]
+    parts = version_line.split()
+    return {
+        "version": parts[2] if len(parts) > 2 else version_line,
+        "encoders": _parse_encoders(_run([path, "-hide_banner", "-encoders"])),
+        "filters": _parse_filters(_run([path, "-hide_banner", "-filters"])),
+        "hwaccels": _parse_hwaccels(_run([path, "-hide_banner", "-hwaccels"])),
+    }
+
+def probe_capabilities(binary="ffmpeg"):
+    """Capabilities dict for `binary`, or None if it is missing / not runnable."""
+    path = shutil.which(binary)
+    if not path:
+        return None
+    st = os.stat(path)
+    key = hashlib.sha1(f"{os.path.realpath(path)}|{st.st_size}|{st.st_mtime_ns}".encode("utf-8")).hexdigest()
+    if key in _memo:
+        return _memo[key]
+    cache_file = os.path.join(cache_dir("capabilities"), key + ".json")
+    try:
+        with open(cache_file, "r", encoding="utf-8") as f:
+            caps = json.load(f)
+        if caps.get("caps_version") == CAPS_VERSION:
+            _memo[key] = caps
+            return caps
+    except Exception:
+        pass
+    try:
+        caps = _detect(path)
+    except Exception:
+        return None
+    caps["caps_version"] = CAPS_VERSION
+    caps["path"] = path
+    tmp = cache_file + ".part"
+    try:
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(caps, f)
+        os.replace(tmp, cache_file)
+    except OSError:
+        pass
+    _memo[key] = caps
+    return caps
+
+def _pick(caps, kind, preferred):
+    if not caps:
+        return preferred[0]
+    available = caps["encoders"].get(kind, [])
+    for name in preferred:
+        if name in available:
+            return name
+    raise RuntimeError(f"ffmpeg build has none of the supported {kind} encoders: {', '.join(preferred)}")
+
+def video_codec_args(caps, preset="fast", crf=23):
+    encoder = _pick(caps, "video", VIDEO_ENCODERS)
+    if encoder == "libx264":
+        return ["-c:v", encoder, "-preset", preset, "-crf", str(crf)]
+    if encoder == "mpeg4":
+        return ["-c:v", encoder, "-q:v", "3" if crf <= 23 else "6"]
+    return ["-c:v", encoder, "-b:v", "6M" if crf <= 23 else "2M"]
+
+def audio_codec_args(caps, bitrate=None):
+    args = ["-c:a", _pick(caps, "audio", AUDIO_ENCODERS)]
+    if bitrate:
+        args += ["-b:a", bitrate]
+    return args
+
+def available_filters(caps):
+    return set(caps["filters"]) if caps and caps.get("filters") else None
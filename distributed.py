@@ -0,0 +1,320 @@
+"""
+Distributed segment rendering over TCP.
+
+The coordinator rolls the timeline once, splits the input into keyframe
+aligned time segments (stream copy, no re-encode) and ships each segment plus
+the rolled plan to worker processes. Workers render with render_plan() and
+send the result back; segments from lost or failing workers are retried on
+the remaining ones. The results are stitched with a copy-concat.
+
+Only timelines whose effects act locally in time can be split: filter-only
+effects (Reverse is handled by reversing the segment order), ConcatDeluxe
+and ChaosTimeline. RandomCuts / RandomClipShuffle sample the whole input and
+asset injections would repeat once per segment, so those fall back to a
+normal local render.
+
+Start a worker with:  python distributed.py --serve --host 0.0.0.0 --port 9631
+
+Workers render whatever plan they are sent, including asset paths, so run
+them on a trusted network only. Setting YTP_WORKER_SECRET to the same value
+on the workers and the coordinator makes workers reject requests that do
+not carry it.
+"""
+import os
+import sys
+import hmac
+import json
+import queue
+import shutil
+import socket
+import struct
+import tempfile
+import threading
+import subprocess
+import socketserver
+
+import ffmpeg_backend as backend
+import analysis as media_analysis
+
+DEFAULT_PORT = 9631
+SECRET_ENV = "YTP_WORKER_SECRET"
+CHUNK = 1024 * 1024
+SEGMENTABLE_MARKERS = {"__CONCAT_DELUXE__", "__CHAOS_TIMELINE__"}
+
+class RemoteRenderError(RuntimeError):
+    pass
+
+# --- wire format: 4-byte length + JSON header, then header["size"] payload bytes ---
+def _recv_exact(sock, n):
+    buf = bytearray()
+    while len(buf) < n:
+        chunk = sock.recv(min(CHUNK, n - len(buf)))
+        if not chunk:
+            raise ConnectionError("connection closed mid-message")
+        buf += chunk
+    return bytes(buf)
+
+def send_message(sock, header, payload_path=None):
+    size = os.path.getsize(payload_path) if payload_path else 0
+    raw = json.dumps(dict(header, size=size)).encode("utf-8")
+    sock.sendall(struct.pack("!I", len(raw)) + raw)
+    if payload_path:
+        with open(payload_path, "rb") as f:
+            sock.sendfile(f)
+
+def _recv_header(sock):
+    (n,) = struct.unpack("!I", _recv_exact(sock, 4))
+    return json.loads(_recv_exact(sock, n).decode("utf-8"))
+
+def _recv_payload(sock, header, payload_path=None):
+    remaining = header.get("size", 0)
+    out = open(payload_path, "wb") if payload_path and remaining else None
+    try:
+        while remaining:
+            chunk = sock.recv(min(CHUNK, remaining))
+            if not chunk:
+                raise ConnectionError("connection closed mid-payload")
+            if out:
+                out.write(chunk)
+            remaining -= len(chunk)
+    finally:
+        if out:
+            out.close()
+
+def recv_message(sock, payload_path=None):
+    header = _recv_header(sock)
+    _recv_payload(sock, header, payload_path)
+    return header
+
+def _secret():
+    return os.environ.get(SECRET_ENV) or None
+
+def _authorized(secret, header):
+    if not secret:
+        return True
+    return hmac.compare_digest(str(header.get("secret", "")).encode("utf-8"), secret.encode("utf-8"))
+
+# --- worker ---
+class _WorkerHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        tempdir = tempfile.mkdtemp(prefix="ytp_worker_")
+        try:
+            src = os.path.join(tempdir, "segment_in.mp4")
+            dst = os.path.join(tempdir, "segment_out.mp4")
+            # Check the secret before accepting a payload
+            header = _recv_header(self.request)
+            if not _authorized(self.server.secret, header):
+                send_message(self.request, {"ok": False, "error": "unauthorized"})
+                return
+            _recv_payload(self.request, header, src)
+            op = header.get("op")
+            if op == "ping":
+                send_message(self.request, {"ok": True})
+                return
+            if op != "render":
+                send_message(self.request, {"ok": False, "error": f"unknown op {op!r}"})
+                return
+            try:
+                backend.render_plan(src, dst, header["applied"], preview=header.get("preview", False))
+            except Exception as e:
+                send_message(self.request, {"ok": False, "error": str(e)})
+                return
+            send_message(self.request, {"ok": True, "task": header.get("task")}, dst)
+        finally:
+            shutil.rmtree(tempdir, ignore_errors=True)
+
+class _WorkerServer(socketserver.TCPServer):
+    allow_reuse_address = True
+
+def serve(host="127.0.0.1", port=DEFAULT_PORT, secret=None):
+    # One render at a time per worker; the coordinator never sends more
+    secret = secret or _secret()
+    if not secret and host not in ("127.0.0.1", "localhost", "::1"):
+        print(f"warning: worker on {host}:{port} accepts plans from anyone who can reach it; "
+              f"set {SECRET_ENV} on workers and coordinator", file=sys.stderr)
+    with _WorkerServer((host, port), _WorkerHandler) as server:
+        server.secret = secret
+        server.serve_forever()
+
+def _free_port(host):
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind((host, 0))
+        return s.getsockname()[1]
+
+def ping(address, timeout=1.0, secret=None):
+    try:
+        with socket.create_connection(address, timeout=timeout) as sock:
+            send_message(sock, {"op": "ping", "secret": secret or _secret()})
+            return recv_message(sock).get("ok", False)
+    except (OSError, ValueError, struct.error):
+        return False
+
+def start_local_workers(count, host="127.0.0.1", startup_timeout=10.0):
+    """Spawn `count` worker processes on this machine; returns (procs, addresses).
+
+    Workers inherit this process's environment, including YTP_WORKER_SECRET.
+    """
+    import time
+    procs, addresses = [], []
+    here = os.path.dirname(os.path.abspath(__file__))
+    for _ in range(count):
+        port = _free_port(host)
+        procs.append(subprocess.Popen([sys.executable, os.path.join(here, "distributed.py"), "--serve", "--host", host, "--port", str(port)], cwd=here))
+        addresses.append((host, port))
+    deadline = time.time() + startup_timeout
+    for address in addresses:
+        while not ping(address):
+            if time.time() > deadline:
+                stop_local_workers(procs)
+                raise RuntimeError(f"worker {address[0]}:{address[1]} did not start")
+            time.sleep(0.05)
+    return procs, addresses
+
+def stop_local_workers(procs):
+    for p in procs:
+        if p.poll() is None:
+            p.terminate()
+    for p in procs:
+        try:
+            p.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            p.kill()
+
+# --- coordinator ---
+def _segment_plan(applied):
+    # (segmentable, reverse_order): Reverse on every segment == reversed segment order
+    reverses = 0
+    for step in backend._resolve_steps(applied):
+        if not step.is_plain() and not set(step.extras) <= SEGMENTABLE_MARKERS:
+            return False, False
+        reverses += sum(1 for f in step.vf if f.name == "reverse")
+    return True, reverses % 2 == 1
+
+def _split_points(src, duration, count):
+    # (bounds, copyable): copyable[i] is True when segment i starts on a
+    # keyframe, the only case where a stream-copy cut does not overlap the
+    # previous segment (long GOPs often leave no keyframe near a boundary)
+    try:
+        keyframes = media_analysis.scan_keyframes(src, backend.FFPROBE)
+    except Exception:
+        keyframes = []
+    info = media_analysis.MediaAnalysis(keyframes=keyframes)
+    keyset = set(keyframes)
+    seg_len = duration / count
+    bounds, copyable = [0.0], [True]
+    for i in range(1, count):
+        b = info.snap_keyframe(i * seg_len, window=seg_len / 2)
+        if b > bounds[-1] + 0.1 and b < duration - 0.1:
+            bounds.append(b)
+            copyable.append(b in keyset)
+    bounds.append(duration)
+    return bounds, copyable
+
+def _cut_segment(src, dst, start, length, copy):
+    if not copy:
+        backend._extract_segment(src, dst, start, length)
+        return
+    # Keyframe-aligned start (or 0): stream copy is exact and costs no re-encode.
+    # Microsecond precision, as ffprobe reports it; -ss rounded to ms can land past the keyframe
+    cmd = [backend.FFMPEG, "-y", "-ss", f"{start:.6f}", "-i", src, "-t", f"{length:.6f}",
+           "-c", "copy", "-avoid_negative_ts", "make_zero", dst]
+    backend._run_ffmpeg_blocking(cmd)
+
+def _dispatch(address, task, applied, preview, timeout, secret=None):
+    with socket.create_connection(address, timeout=timeout) as sock:
+        sock.settimeout(timeout)
+        send_message(sock, {"op": "render", "task": task["index"], "applied": applied, "preview": preview, "secret": secret},
+                     task["src"])
+        header = recv_message(sock, task["dst"])
+    if not header.get("ok"):
+        raise RemoteRenderError(header.get("error", "remote render failed"))
+
+def render_distributed(input_path, output_path, timeline, workers, segments=None, preview=False,
+                       max_attempts=3, timeout=3600.0, on_progress=None, secret=None):
+    """Render timeline by farming time segments out to worker addresses [(host, port), ...].
+
+    secret defaults to the YTP_WORKER_SECRET environment variable.
+    """
+    if not os.path.exists(input_path):
+        raise FileNotFoundError("Input not found: " + input_path)
+    secret = secret or _secret()
+    applied = backend._roll_timeline(timeline)
+    segmentable, reverse_order = _segment_plan(applied)
+    # A preview is a short clip of the start, so it is never worth splitting
+    if preview or not segmentable or not workers:
+        if on_progress:
+            on_progress("Preview or unsplittable timeline; rendering locally")
+        backend.render_plan(input_path, output_path, applied, preview=preview, on_progress=on_progress)
+        return
+    duration = backend._probe_duration(input_path)
+    if duration <= 0:
+        raise RuntimeError("Cannot probe duration for source.")
+    bounds, copyable = _split_points(input_path, duration, segments or len(workers) * 2)
+    tempdir = tempfile.mkdtemp(prefix="ytp_dist_")
+    try:
+        tasks = []
+        for i in range(len(bounds) - 1):
+            task = {"index": i, "attempts": 0,
+                    "src": os.path.join(tempdir, f"seg_{i}.mp4"), "dst": os.path.join(tempdir, f"seg_{i}_out.mp4")}
+            _cut_segment(input_path, task["src"], bounds[i], bounds[i + 1] - bounds[i], copyable[i])
+            tasks.append(task)
+        pending = queue.Queue()
+        for task in tasks:
+            pending.put(task)
+        done, failures = set(), []
+        lock = threading.Lock()
+
+        def worker_loop(address):
+            while True:
+                with lock:
+                    if failures or len(done) == len(tasks):
+                        return
+                try:
+                    task = pending.get(timeout=0.2)
+                except queue.Empty:
+                    continue
+                try:
+                    _dispatch(address, task, applied, preview, timeout, secret)
+                except (OSError, ValueError, struct.error, RemoteRenderError) as e:
+                    task["attempts"] += 1
+                    with lock:
+                        if task["attempts"] >= max_attempts:
+                            failures.append(f"segment {task['index']}: {e}")
+                            return
+                    pending.put(task)
+                    if not isinstance(e, RemoteRenderError):
+                        return  # worker lost; the others pick up its segment
+                    continue
+                with lock:
+                    done.add(task["index"])
+                    if on_progress:
+                        on_progress(f"Segments rendered: {len(done)}/{len(tasks)}")
+
+        threads = [threading.Thread(target=worker_loop, args=(tuple(a),), daemon=True) for a in workers]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        if failures or len(done) != len(tasks):
+            raise RuntimeError("Distributed render failed: " + ("; ".join(failures) or "all workers lost"))
+        outputs = [t["dst"] for t in tasks]
+        if reverse_order:
+            outputs.reverse()
+        backend._concat_files(outputs, output_path)
+    finally:
+        shutil.rmtree(tempdir, ignore_errors=True)
+
+def parse_address(text):
+    host, _, port = text.rpartition(":")
+    return (host or "127.0.0.1", int(port))
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="YTP+ segment render worker")
+    parser.add_argument("--serve", action="store_true", help="run a worker")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    args = parser.parse_args()
+    if not args.serve:
+        parser.error("nothing to do (use --serve)")
+    serve(args.host, args.port)
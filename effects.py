@@ -9,6 +9,7 @@ the correct assets directory provided by GUI/CLI.
 from dataclasses import dataclass, asdict
 import random
 from typing import Dict, Any
+from filtergraph import chain, atempo_chain
 
 @dataclass
 class EffectInstance:
@@ -33,38 +34,24 @@ class EffectInstance:
 
 # --- Effect factories ---
 def _effect_reverse(level, params, preview=False):
-    return ("reverse", "areverse", [])
+    return (chain("reverse"), chain("areverse"), [])
 
 def _effect_speed(level, params, preview=False):
     lvl = max(1, min(10, level))
     factor = 0.5 + (lvl - 1) * (2.5 / 9)
-    vf = f"setpts=PTS/{factor}"
-    def decompose(x):
-        parts = []
-        while x > 2.0:
-            parts.append(2.0)
-            x /= 2.0
-        while x < 0.5:
-            parts.append(0.5)
-            x /= 0.5
-        if abs(x - 1.0) > 1e-6:
-            parts.append(x)
-        if not parts:
-            parts = [1.0]
-        return parts
-    at_list = decompose(factor)
-    af = ",".join([f"atempo={f:.6f}" for f in at_list])
+    vf = chain(("setpts", f"PTS/{factor}"))
+    af = atempo_chain(factor)
     return (vf, af, [])
 
 def _effect_invert(level, params, preview=False):
-    return ("negate", None, [])
+    return (chain("negate"), None, [])
 
 def _effect_mirror(level, params, preview=False):
-    return ("hflip", None, [])
+    return (chain("hflip"), None, [])
 
 def _effect_rainbow_overlay(level, params, preview=False):
     path = params.get("overlay") if params else "assets/rainbow.png"
-    return (f"overlay=10:10", None, [path])
+    return (chain(("overlay", "10:10")), None, [path])
 
 def _effect_add_random_sound(level, params, preview=False):
     # Backend will choose a random sound from the provided directory
@@ -78,21 +65,24 @@ def _effect_add_random_sound(level, params, preview=False):
 def _effect_earrape(level, params, preview=False):
     lvl = max(1, min(10, level))
     gain = 1.0 + lvl * 3.0
-    return (None, f"volume={gain}", [])
+    return (None, chain(("volume", f"{gain}")), [])
 
 def _effect_chorus(level, params, preview=False):
     delay = 40 + level * 5
     decay = 0.2 + level * 0.05
-    return (None, f"aecho=0.8:0.9:{delay}|{delay*2}:{decay}|{decay*0.7}", [])
+    return (None, chain(("aecho", f"0.8:0.9:{delay}|{delay*2}:{decay}|{decay*0.7}")), [])
+
+def _pitch_chain(factor):
+    return chain(("asetrate", f"44100*{factor:.5f}"), ("aresample", "44100"), ("atempo", f"{1/factor:.5f}"))
 
 def _effect_vibrato(level, params, preview=False):
     semitones = (level - 5) * 0.5
     factor = 2 ** (semitones / 12.0)
-    af = f"asetrate=44100*{factor:.5f},aresample=44100,atempo={1/factor:.5f}"
+    af = _pitch_chain(factor)
     return (None, af, [])
 
 def _effect_stutter(level, params, preview=False):
-    return ("fps=25", None, ["__STUTTER__"])
+    return (chain(("fps", "25")), None, ["__STUTTER__"])
 
 def _effect_frame_shuffle(level, params, preview=False):
     return (None, None, ["__FRAME_SHUFFLE__"])
@@ -107,16 +97,16 @@ def _effect_inject_meme(level, params, preview=False):
     if not memes_dir:
         memes_dir = "assets/memes"
     # overlay default position; backend uses chosen file and the vf overlay instruction
-    return ("overlay=W-w-10:10", None, [memes_dir])
+    return (chain(("overlay", "W-w-10:10")), None, [memes_dir])
 
 def _effect_pitch_shift(level, params, preview=False):
     semitones = (level - 5) * 1.2
     factor = 2 ** (semitones / 12.0)
-    af = f"asetrate=44100*{factor:.5f},aresample=44100,atempo={1/factor:.5f}"
+    af = _pitch_chain(factor)
     return (None, af, [])
 
 def _effect_low_quality(level, params, preview=False):
-    vf = f"scale=iw/2:ih/2,scale=iw*2:ih*2,format=yuv420p"
+    vf = chain(("scale", "iw/2:ih/2"), ("scale", "iw*2:ih*2"), ("format", "yuv420p"))
     return (vf, None, [])
 
 # Concat / Deluxe markers (backend handles)
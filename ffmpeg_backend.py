@@ -6,25 +6,40 @@ This file builds on the previous implementation and ensures AddRandomSound /
 InjectMeme work with user-specified directories.
 """
 import os
+import json
 import subprocess
 import random
 import glob
 import tempfile
 import shutil
+from collections import OrderedDict
+from dataclasses import dataclass
 from typing import List
 from effects import EFFECT_REGISTRY, EffectInstance
+from filtergraph import Chain, optimize as optimize_chain, validate as validate_chain, time_map
+from utils import cache_dir, file_cache_key, evict_lru
+import analysis as media_analysis
+import capabilities
+import soundbank
+import tracing
 
 FFMPEG = "ffmpeg"
 FFPROBE = "ffprobe"
 
 def check_ffmpeg():
-    try:
-        subprocess.run([FFMPEG, "-version"], stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True)
-        return True
-    except Exception:
-        return False
+    # Cached capability probe: no process is spawned unless the binary changed
+    return capabilities.probe_capabilities(FFMPEG) is not None
+
+def _caps():
+    return capabilities.probe_capabilities(FFMPEG)
+
+def _venc(preset="fast", crf=23):
+    return capabilities.video_codec_args(_caps(), preset=preset, crf=crf)
 
-def _choose_random_asset(path):
+def _aenc(bitrate=None):
+    return capabilities.audio_codec_args(_caps(), bitrate)
+
+def _choose_random_asset(path, rng=random):
     # If path is a file, return it. If dir, pick a random supported file.
     if not path:
         return None
@@ -36,34 +51,225 @@ def _choose_random_asset(path):
             files.extend(glob.glob(os.path.join(path, ext)))
         if not files:
             return None
-        return random.choice(files)
+        return rng.choice(files)
     return None
 
 def _run_ffmpeg_blocking(cmd):
     try:
-        proc = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, check=True)
+        proc = tracing.run(cmd)
     except subprocess.CalledProcessError as e:
         raise RuntimeError(f"ffmpeg failed (rc={e.returncode}):\n{e.stderr}") from e
     return proc.stdout, proc.stderr
 
+_duration_memo = OrderedDict()
+DURATION_MEMO_SIZE = 256
+
 def _probe_duration(path):
+    # Memoized per file version (LRU-bounded) so repeated renders of one input probe it once
     try:
+        key = file_cache_key(path)
+        if key in _duration_memo:
+            _duration_memo.move_to_end(key)
+            return _duration_memo[key]
         cmd = [FFPROBE, "-v", "error", "-show_entries", "format=duration", "-of", "default=nk=1:nw=1", path]
-        out = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, check=True)
-        return float(out.stdout.strip())
+        with tracing.span(stage="probe"):
+            out = tracing.run(cmd)
+        duration = _duration_memo[key] = float(out.stdout.strip())
+        while len(_duration_memo) > DURATION_MEMO_SIZE:
+            _duration_memo.popitem(last=False)
+        return duration
     except Exception:
         return 0.0
 
+def _has_audio(path):
+    try:
+        cmd = [FFPROBE, "-v", "error", "-select_streams", "a", "-show_entries", "stream=index", "-of", "csv=p=0", path]
+        with tracing.span(stage="probe"):
+            out = tracing.run(cmd)
+        return bool(out.stdout.strip())
+    except Exception:
+        return True
+
+def _probe_video_size(path):
+    try:
+        cmd = [FFPROBE, "-v", "error", "-select_streams", "v:0", "-show_entries", "stream=width,height", "-of", "csv=p=0:s=x", path]
+        with tracing.span(stage="probe"):
+            out = tracing.run(cmd)
+        w, h = out.stdout.strip().splitlines()[0].split("x")[:2]
+        return int(w), int(h)
+    except Exception:
+        return 0, 0
+
 # Simple extraction + normalization helper for concat compatibility
 def _extract_segment(src, dst, start_s, duration_s):
     cmd = [
         FFMPEG, "-y", "-ss", f"{start_s:.3f}", "-i", src,
         "-t", f"{duration_s:.3f}",
-        "-c:v", "libx264", "-preset", "fast", "-crf", "23",
-        "-c:a", "aac", "-b:a", "192k",
+        *_venc("fast", 23),
+        *_aenc("192k"),
         dst
     ]
-    _run_ffmpeg_blocking(cmd)
+    with tracing.span(stage="extract"):
+        _run_ffmpeg_blocking(cmd)
+
+# RandomCuts / RandomClipShuffle seek into the same source dozens of times. On
+# a long-GOP input every -ss decodes from the previous keyframe, so those
+# effects are served from an all-intra mezzanine where every frame is a keyframe.
+# The cache is bounded: least recently used mezzanines go first.
+MEZZANINE_MAX_BYTES = int(os.environ.get("YTP_MEZZANINE_MAX_BYTES", 20 * 1024 ** 3))
+MEZZANINE_MIN_AGE = 600.0
+# GOP assumed when keyframes cannot be scanned (x264 default keyint 250 at 25 fps)
+DEFAULT_GOP_S = 10.0
+
+def _mezzanine_video_args():
+    caps = _caps()
+    if caps and "libx264" not in caps["encoders"]["video"]:
+        # mjpeg is intra-only and present in practically every build
+        return ["-c:v", "mjpeg", "-q:v", "2"]
+    return ["-c:v", "libx264", "-preset", "ultrafast", "-crf", "18", "-g", "1", "-bf", "0"]
+
+def _make_mezzanine(src, dst):
+    # Unique temp name: concurrent renders of one input must not share a .part
+    fd, tmp = tempfile.mkstemp(suffix=".part", dir=os.path.dirname(dst))
+    os.close(fd)
+    cmd = [
+        FFMPEG, "-y", "-i", src,
+        *_mezzanine_video_args(),
+        "-c:a", "pcm_s16le",
+        "-f", "matroska", tmp
+    ]
+    try:
+        with tracing.span(stage="mezzanine"):
+            _run_ffmpeg_blocking(cmd)
+        os.replace(tmp, dst)
+    finally:
+        if os.path.exists(tmp):
+            try:
+                os.remove(tmp)
+            except Exception:
+                pass
+
+def _mezzanine_for(src, directory=None, spill_dir=None):
+    # Cached per input (path + size + mtime). Pass a job temp dir for
+    # intermediates so they are cleaned up with the job; a cached build larger
+    # than the whole cache moves to spill_dir (job-scoped) instead.
+    cached = directory is None
+    if cached:
+        directory = cache_dir("mezzanine")
+    dst = os.path.join(directory, file_cache_key(src) + ".mkv")
+    if os.path.exists(dst):
+        if cached:
+            try:
+                os.utime(dst)  # LRU: mtime doubles as last-access time
+            except OSError:
+                pass
+        return dst
+    _make_mezzanine(src, dst)
+    if cached:
+        if os.path.getsize(dst) > MEZZANINE_MAX_BYTES:
+            # Keeping it would evict every other entry and still exceed the cap
+            if not spill_dir:
+                os.remove(dst)
+                raise RuntimeError("mezzanine larger than the cache size limit")
+            spilled = os.path.join(spill_dir, os.path.basename(dst))
+            shutil.move(dst, spilled)
+            return spilled
+        evict_lru(directory, ".mkv", MEZZANINE_MAX_BYTES, keep=dst, min_age=MEZZANINE_MIN_AGE)
+    return dst
+
+def _gop_seconds(path, analysis=None):
+    keys = analysis.keyframes if analysis is not None and analysis.keyframes else None
+    if keys is None:
+        try:
+            keys = media_analysis.scan_keyframes(path, FFPROBE)
+        except Exception:
+            return DEFAULT_GOP_S
+    if len(keys) < 2:
+        return _probe_duration(path) or DEFAULT_GOP_S  # one GOP spans the whole file
+    return (keys[-1] - keys[0]) / (len(keys) - 1)
+
+def _is_cached_input(working, input_path):
+    # input_path is None when the render's input is itself a scratch file (intro merge)
+    return input_path is not None and os.path.abspath(working) == os.path.abspath(input_path)
+
+def _cut_source(working, input_path, tempdir, cuts, preview=False, analysis=None):
+    # Preview only takes a handful of short cuts; a full transcode would cost more than it saves
+    if preview:
+        return working
+    is_input = _is_cached_input(working, input_path)
+    if not is_input:
+        # An intermediate's mezzanine is used once and thrown away: only build it
+        # when the seeks would decode more than one pass over the file (each -ss
+        # decodes half a GOP on average)
+        duration = _probe_duration(working)
+        if duration <= 0 or cuts * _gop_seconds(working, analysis) / 2.0 <= duration:
+            return working
+    try:
+        return _mezzanine_for(working, None if is_input else tempdir, spill_dir=tempdir)
+    except RuntimeError:
+        return working
+
+def _input_analysis(input_path, directory=None, preview=False):
+    # One analysis decode per render input, then a cached sidecar
+    if preview:
+        return media_analysis.load_analysis(input_path, directory)
+    try:
+        with tracing.span(stage="analysis"):
+            return media_analysis.get_analysis(input_path, directory, ffmpeg=FFMPEG, ffprobe=FFPROBE)
+    except Exception:
+        return None
+
+def _carried_analysis(input_path, vf, af, directory=None, preview=False):
+    # Input analysis mapped through the filter-only chain that produced the
+    # current file; None if the chain retimes in a way time_map cannot follow
+    base = _input_analysis(input_path, directory, preview=preview)
+    if base is None or (not vf and not af):
+        return base
+    duration = _probe_duration(input_path)
+    video_map = time_map(vf, duration) if duration > 0 else None
+    if video_map is None:
+        return None
+    return base.remapped(video_map, time_map(af, duration))
+
+def _snaps(step):
+    # Cut-placing step that wants its cut points snapped to boundaries
+    placing = any(e in CUT_MARKERS or e == "__CONCAT_DELUXE__" for e in step.extras)
+    return placing and step.params.get("snap", True)
+
+def _step_analysis(steps, n, input_path, directory=None, preview=False):
+    # Analysis for steps[n], carried from the input when only filter-only steps precede it
+    if not _snaps(steps[n]) or any(not s.is_plain() for s in steps[:n]):
+        return None
+    vf, af = Chain(), Chain()
+    for s in steps[:n]:
+        vf, af = vf + s.vf, af + s.af
+    return _carried_analysis(input_path, vf, af, directory, preview=preview)
+
+def _analysis_for(working, tempdir, params, preview=False):
+    # Fallback for a file no input analysis maps onto (after a cut or asset
+    # step): a full extra decode, so only when the effect asks with "snap": true
+    if params.get("snap") is not True:
+        return None
+    if preview:
+        return media_analysis.load_analysis(working, tempdir)
+    try:
+        with tracing.span(stage="analysis"):
+            return media_analysis.get_analysis(working, tempdir, ffmpeg=FFMPEG, ffprobe=FFPROBE)
+    except Exception:
+        return None
+
+# Cut starts snap to boundaries at most this far away; a wider window pulls
+# most random starts onto the same few boundaries and clips repeat
+SNAP_WINDOW = 0.5
+
+def _snapped_start(analysis, start, seg_len, duration, used):
+    # Each boundary is used at most once per effect so clips stay distinct
+    if analysis is None:
+        return start
+    snapped = analysis.snap(start, window=min(seg_len / 2.0, SNAP_WINDOW), exclude=used)
+    if snapped != start:
+        used.add(snapped)
+    return min(max(0.0, snapped), max(0.0, duration - seg_len))
 
 def _make_concat_list(files):
     fd, path = tempfile.mkstemp(suffix=".txt")
@@ -73,6 +279,10 @@ def _make_concat_list(files):
     return path
 
 def _concat_files(file_list, dst):
+    with tracing.span(stage="concat"):
+        _concat_files_impl(file_list, dst)
+
+def _concat_files_impl(file_list, dst):
     list_path = _make_concat_list(file_list)
     try:
         cmd = [FFMPEG, "-y", "-f", "concat", "-safe", "0", "-i", list_path, "-c", "copy", dst]
@@ -89,7 +299,7 @@ def _concat_files(file_list, dst):
             afilt = "".join([f"[{i}:a:0]" for i in range(n)]) + f"concat=n={n}:v=0:a=1[outa]"
             filter_complex = vfilt + ";" + afilt
             tmp = dst + ".tmp_reencode.mp4"
-            cmd2 = [FFMPEG, "-y"] + inputs + ["-filter_complex", filter_complex, "-map", "[outv]", "-map", "[outa]", "-c:v", "libx264", "-preset", "fast", "-crf", "23", "-c:a", "aac", "-b:a", "192k", tmp]
+            cmd2 = [FFMPEG, "-y"] + inputs + ["-filter_complex", filter_complex, "-map", "[outv]", "-map", "[outa]"] + _venc("fast", 23) + _aenc("192k") + [tmp]
             _run_ffmpeg_blocking(cmd2)
             shutil.move(tmp, dst)
     finally:
@@ -99,7 +309,7 @@ def _concat_files(file_list, dst):
             pass
 
 # Implementations for concat-deluxe and related behaviors
-def _random_clip_shuffle_impl(src, dst, clip_count=6, min_len=0.5, max_len=2.5, preview=False):
+def _random_clip_shuffle_impl(src, dst, clip_count=6, min_len=0.5, max_len=2.5, preview=False, analysis=None, rng=random):
     if preview:
         clip_count = min(4, clip_count)
         max_len = min(max_len, 1.0)
@@ -107,13 +317,15 @@ def _random_clip_shuffle_impl(src, dst, clip_count=6, min_len=0.5, max_len=2.5,
     if duration <= 0:
         raise RuntimeError("Cannot probe duration for source.")
     temps = []
+    used = set()
     for i in range(clip_count):
-        seg_len = random.uniform(min_len, max_len)
-        start = random.uniform(0, max(0, duration - seg_len))
+        seg_len = rng.uniform(min_len, max_len)
+        start = rng.uniform(0, max(0, duration - seg_len))
+        start = _snapped_start(analysis, start, seg_len, duration, used)
         temp_path = os.path.join(tempfile.gettempdir(), f"ytp_shuffle_{os.getpid()}_{i}.mp4")
         _extract_segment(src, temp_path, start, seg_len)
         temps.append(temp_path)
-    random.shuffle(temps)
+    rng.shuffle(temps)
     _concat_files(temps, dst)
     for t in temps:
         try:
@@ -121,7 +333,7 @@ def _random_clip_shuffle_impl(src, dst, clip_count=6, min_len=0.5, max_len=2.5,
         except Exception:
             pass
 
-def _random_cuts_impl(src, dst, cuts=30, min_len=0.05, max_len=0.3, preview=False):
+def _random_cuts_impl(src, dst, cuts=30, min_len=0.05, max_len=0.3, preview=False, analysis=None, rng=random):
     if preview:
         cuts = min(12, cuts)
         max_len = min(max_len, 0.15)
@@ -129,13 +341,15 @@ def _random_cuts_impl(src, dst, cuts=30, min_len=0.05, max_len=0.3, preview=Fals
     if duration <= 0:
         raise RuntimeError("Cannot probe duration for source.")
     temps = []
+    used = set()
     for i in range(cuts):
-        seg_len = random.uniform(min_len, max_len)
-        start = random.uniform(0, max(0, duration - seg_len))
+        seg_len = rng.uniform(min_len, max_len)
+        start = rng.uniform(0, max(0, duration - seg_len))
+        start = _snapped_start(analysis, start, seg_len, duration, used)
         temp_path = os.path.join(tempfile.gettempdir(), f"ytp_cuts_{os.getpid()}_{i}.mp4")
         _extract_segment(src, temp_path, start, seg_len)
         temps.append(temp_path)
-    random.shuffle(temps)
+    rng.shuffle(temps)
     _concat_files(temps, dst)
     for t in temps:
         try:
@@ -143,21 +357,30 @@ def _random_cuts_impl(src, dst, cuts=30, min_len=0.05, max_len=0.3, preview=Fals
         except Exception:
             pass
 
-def _concat_deluxe_impl(src, dst, parts=6, preview=False):
+def _concat_deluxe_impl(src, dst, parts=6, preview=False, analysis=None, rng=random):
     duration = _probe_duration(src)
     if duration <= 0:
         raise RuntimeError("Cannot probe duration for source.")
     parts = max(2, parts)
     seg_len = duration / parts
+    bounds = [0.0]
+    for i in range(1, parts):
+        b = i * seg_len
+        if analysis is not None:
+            snapped = analysis.snap(b, window=seg_len / 2)
+            if bounds[-1] + 0.1 < snapped < duration - 0.1:
+                b = snapped
+        bounds.append(b)
+    bounds.append(duration)
     temps = []
     for i in range(parts):
-        start = i * seg_len
+        start = bounds[i]
         temp_path = os.path.join(tempfile.gettempdir(), f"ytp_conc_{os.getpid()}_{i}.mp4")
-        _extract_segment(src, temp_path, start, seg_len)
+        _extract_segment(src, temp_path, start, bounds[i + 1] - start)
         temps.append(temp_path)
     out_list = []
     for t in temps:
-        r = random.random()
+        r = rng.random()
         if r < 0.12:
             out_list.append(t); out_list.append(t)
         elif r < 0.22:
@@ -166,8 +389,8 @@ def _concat_deluxe_impl(src, dst, parts=6, preview=False):
             out_list.append(rev)
         else:
             out_list.append(t)
-    if random.random() < 0.3:
-        random.shuffle(out_list)
+    if rng.random() < 0.3:
+        rng.shuffle(out_list)
     _concat_files(out_list, dst)
     for f in temps + [x for x in out_list if x.endswith(".rev.mp4")]:
         try:
@@ -175,7 +398,7 @@ def _concat_deluxe_impl(src, dst, parts=6, preview=False):
         except Exception:
             pass
 
-def _chaos_timeline_impl(src, dst, segments=8, preview=False):
+def _chaos_timeline_impl(src, dst, segments=8, preview=False, rng=random):
     if preview:
         segments = min(6, segments)
     duration = _probe_duration(src)
@@ -190,11 +413,11 @@ def _chaos_timeline_impl(src, dst, segments=8, preview=False):
         tmp_in = os.path.join(tempfile.gettempdir(), f"ytp_chaos_in_{os.getpid()}_{i}.mp4")
         tmp_out = os.path.join(tempfile.gettempdir(), f"ytp_chaos_out_{os.getpid()}_{i}.mp4")
         _extract_segment(src, tmp_in, start, seg_len)
-        choice = random.choice(["hflip", "negate", "tblend=all_mode=average,framestep=1", None, None])
+        choice = rng.choice(["hflip", "negate", "tblend=all_mode=average,framestep=1", None, None])
         cmd = [FFMPEG, "-y", "-i", tmp_in]
         if choice:
             cmd += ["-vf", choice]
-        cmd += ["-c:v", "libx264", "-preset", "fast", "-crf", "23", "-c:a", "aac", "-b:a", "192k", tmp_out]
+        cmd += _venc("fast", 23) + _aenc("192k") + [tmp_out]
         _run_ffmpeg_blocking(cmd)
         processed.append(tmp_out)
         try:
@@ -209,117 +432,608 @@ def _chaos_timeline_impl(src, dst, segments=8, preview=False):
             pass
 
 def _reverse_file(src, dst):
-    cmd = [FFMPEG, "-y", "-i", src, "-vf", "reverse", "-af", "areverse", "-c:v", "libx264", "-preset", "fast", "-crf", "23", "-c:a", "aac", dst]
-    _run_ffmpeg_blocking(cmd)
+    cmd = [FFMPEG, "-y", "-i", src, "-vf", "reverse", "-af", "areverse"] + _venc("fast", 23) + _aenc() + [dst]
+    with tracing.span(stage="reverse"):
+        _run_ffmpeg_blocking(cmd)
 
 # High-level pipeline
-def _apply_effects_sequence(input_path, output_path, timeline: List[EffectInstance], preview=False, on_progress=None):
+SPECIAL_MARKERS = ("__RANDOM_CLIP_SHUFFLE__", "__RANDOM_CUTS__", "__CONCAT_DELUXE__", "__CHAOS_TIMELINE__")
+CUT_MARKERS = ("__RANDOM_CLIP_SHUFFLE__", "__RANDOM_CUTS__")
+
+@dataclass
+class _Step:
+    idx: int
+    name: str
+    level: int
+    params: dict
+    vf: Chain
+    af: Chain
+    extras: list
+
+    def is_plain(self):
+        # Filter-only step: no concat marker and no asset path to overlay/mix
+        for e in self.extras:
+            if e in SPECIAL_MARKERS or os.path.exists(e):
+                return False
+        return True
+
+def _resolve_steps(applied, preview=False):
+    filters = capabilities.available_filters(_caps())
+    steps = []
+    for idx, (ename, level, params) in enumerate(applied):
+        meta = EFFECT_REGISTRY.get(ename)
+        if not meta:
+            continue
+        vf, af, extras = meta["factory"](level, params, preview=preview)
+        step = _Step(idx, ename, level, params, Chain.coerce(vf), Chain.coerce(af), list(extras or []))
+        validate_chain(step.vf, available=filters, label=f"{ename} (step {idx}) video")
+        validate_chain(step.af, available=filters, label=f"{ename} (step {idx}) audio")
+        steps.append(step)
+    return steps
+
+def _fuse_plain_steps(steps):
+    # Consecutive filter-only steps become one ffmpeg run with an optimized chain
+    fused = []
+    for step in steps:
+        if step.is_plain() and fused and fused[-1].is_plain():
+            prev = fused[-1]
+            fused[-1] = _Step(prev.idx, prev.name + "+" + step.name, prev.level, prev.params,
+                              prev.vf + step.vf, prev.af + step.af, [])
+        else:
+            fused.append(step)
+    for step in fused:
+        if step.is_plain():
+            step.vf = optimize_chain(step.vf)
+            step.af = optimize_chain(step.af)
+    return fused
+
+def _render_step(step, working, input_path, tempdir, preview=False, final=None, rng=random, analysis=None):
+    # Run one resolved step on `working`; returns the path of its output.
+    # final=(path, muxer args) makes a filter-only step write the job output directly.
+    idx, level, params = step.idx, step.level, step.params
+    vf, af, extras = step.vf, step.af, step.extras
+    handled_special = False
+    if extras:
+        for e in extras:
+            # Concat-like special markers
+            if e == "__RANDOM_CLIP_SHUFFLE__":
+                out = os.path.join(tempdir, f"randshuffle_{idx}.mp4")
+                clip_count = params.get("clip_count", max(4, level * 2))
+                min_len = params.get("min_len", 0.2)
+                max_len = params.get("max_len", 2.0)
+                info = analysis if analysis is not None else _analysis_for(working, tempdir, params, preview=preview)
+                src = _cut_source(working, input_path, tempdir, clip_count, preview=preview, analysis=info)
+                _random_clip_shuffle_impl(src, out, clip_count=clip_count, min_len=min_len, max_len=max_len, preview=preview, analysis=info, rng=rng)
+                working = out; handled_special = True; break
+            if e == "__RANDOM_CUTS__":
+                out = os.path.join(tempdir, f"randcuts_{idx}.mp4")
+                cuts = params.get("cuts", level * 10)
+                min_len = params.get("min_len", 0.03)
+                max_len = params.get("max_len", 0.25)
+                info = analysis if analysis is not None else _analysis_for(working, tempdir, params, preview=preview)
+                src = _cut_source(working, input_path, tempdir, cuts, preview=preview, analysis=info)
+                _random_cuts_impl(src, out, cuts=cuts, min_len=min_len, max_len=max_len, preview=preview, analysis=info, rng=rng)
+                working = out; handled_special = True; break
+            if e == "__CONCAT_DELUXE__":
+                out = os.path.join(tempdir, f"concatdeluxe_{idx}.mp4")
+                parts = params.get("parts", max(4, level * 2))
+                info = analysis if analysis is not None else _analysis_for(working, tempdir, params, preview=preview)
+                _concat_deluxe_impl(working, out, parts=parts, preview=preview, analysis=info, rng=rng)
+                working = out; handled_special = True; break
+            if e == "__CHAOS_TIMELINE__":
+                out = os.path.join(tempdir, f"chaostl_{idx}.mp4")
+                segments = params.get("segments", max(6, level * 2))
+                _chaos_timeline_impl(working, out, segments=segments, preview=preview, rng=rng)
+                working = out; handled_special = True; break
+        if handled_special:
+            return working
+    # Non-special: handle extras as asset dirs or explicit files
+    chosen_files = []
+    if extras:
+        for e in extras:
+            if os.path.exists(e) and os.path.isdir(e):
+                chosen = _choose_random_asset(e, rng)
+                if chosen:
+                    chosen_files.append(chosen)
+            elif os.path.exists(e) and os.path.isfile(e):
+                chosen_files.append(e)
+            else:
+                # unknown extras marker handled above or ignored
+                pass
+    # If both chosen_files and vf present -> overlay chosen_files[0]
+    if chosen_files and vf:
+        overlay_file = chosen_files[0]
+        tmp_out = os.path.join(tempdir, f"overlay_{idx}.mp4")
+        filter_complex = "[0:v][1:v]overlay=10:10:shortest=1[vout]"
+        cmd = [FFMPEG, "-y", "-i", working, "-i", overlay_file, "-filter_complex", filter_complex, "-map", "[vout]", "-map", "0:a?"] + _venc("fast", 23) + [tmp_out]
+        _run_ffmpeg_blocking(cmd)
+        return tmp_out
+    # If chosen_files and no vf => audio injection (mix)
+    if chosen_files and not vf:
+        overlay_audio = chosen_files[0]
+        tmp_out = os.path.join(tempdir, f"audioinject_{idx}.mp4")
+        delay_ms = rng.randint(0,2000)
+        source_input = ["-i", overlay_audio]
+        sound_input = source_input
+        if soundbank.SoundBank.is_audio(overlay_audio):
+            # Pre-decoded, loudness-normalized PCM at the pipeline rate: no decode/resample per injection
+            try:
+                sound_input = soundbank.default_bank(FFMPEG).input_args(overlay_audio)
+            except (RuntimeError, OSError):
+                pass
+        mix = ["-filter_complex", f"[1:a]adelay={delay_ms}|{delay_ms}[s1];[0:a][s1]amix=inputs=2:duration=first:dropout_transition=3[aout]", "-map", "0:v", "-map", "[aout]", "-c:v", "copy"] + _aenc("192k") + [tmp_out]
+        try:
+            _run_ffmpeg_blocking([FFMPEG, "-y", "-i", working] + sound_input + mix)
+        except RuntimeError:
+            if sound_input is source_input or os.path.exists(sound_input[-1]):
+                raise
+            # Bank entry evicted by another process before ffmpeg opened it: decode the original
+            _run_ffmpeg_blocking([FFMPEG, "-y", "-i", working] + source_input + mix)
+        return tmp_out
+    # Otherwise apply vf/af if present
+    tmp_out = os.path.join(tempdir, f"step_{idx}.mp4")
+    cmd = [FFMPEG, "-y", "-i", working]
+    if vf:
+        cmd += ["-vf", str(vf)]
+    if af:
+        cmd += ["-af", str(af)]
+    if preview:
+        cmd += ["-t", "6"] + _venc("veryfast", 28) + _aenc()
+    else:
+        cmd += _venc("fast", 23) + _aenc()
+    if final:
+        tmp_out = final[0]
+        cmd += final[1]
+    cmd.append(tmp_out)
+    _run_ffmpeg_blocking(cmd)
+    return tmp_out
+
+def _roll_timeline(timeline: List[EffectInstance], rng=random):
+    # Decide which effects fire and at what level: [(name, level, params), ...]
     applied = []
     for inst in timeline:
         if not inst.enabled:
             continue
-        roll = random.randint(0,100)
+        roll = rng.randint(0,100)
         if roll <= inst.probability:
-            level = random.randint(1, max(1, inst.max_level))
+            level = rng.randint(1, max(1, inst.max_level))
             applied.append((inst.name, level, inst.params or {}))
+    return applied
+
+# Output modes. "mp4" moves the finished file into place; "fmp4" has the final
+# stage write a fragmented MP4 to <output>.part (readable while it grows) and
+# renames it when done; "hls" writes an event playlist plus fMP4 segments that
+# players can start on before the render finishes.
+OUTPUT_MODES = ("mp4", "fmp4", "hls")
+
+def _progressive_target(output_path, mode):
+    # (path ffmpeg writes, muxer args) for a progressive output mode
+    if mode == "fmp4":
+        return output_path + ".part", ["-movflags", "+frag_keyframe+empty_moov+default_base_moof", "-f", "mp4"]
+    base = os.path.splitext(output_path)[0]
+    return output_path, [
+        "-f", "hls", "-hls_time", "4", "-hls_playlist_type", "event",
+        "-hls_segment_type", "fmp4", "-hls_flags", "temp_file+independent_segments",
+        "-hls_fmp4_init_filename", os.path.basename(base) + "_init.mp4",
+        "-hls_segment_filename", base + "_%05d.m4s",
+    ]
+
+def _finish_progressive(target, output_path):
+    if os.path.abspath(target) != os.path.abspath(output_path):
+        os.replace(target, output_path)
+
+def _discard_partial(target, output_path):
+    # A failed render must not leave <output>.part next to the user's files
+    if os.path.abspath(target) != os.path.abspath(output_path):
+        try:
+            os.remove(target)
+        except OSError:
+            pass
+
+def _remux_progressive(src, output_path, mode):
+    # Final stage was not a plain filter step: stream-copy it into the progressive muxer
+    target, args = _progressive_target(output_path, mode)
+    try:
+        with tracing.span(stage="remux"):
+            _run_ffmpeg_blocking([FFMPEG, "-y", "-i", src, "-c", "copy"] + args + [target])
+    except BaseException:
+        _discard_partial(target, output_path)
+        raise
+    _finish_progressive(target, output_path)
+
+def _deliver(working, output_path, owned):
+    # Atomic rename into place; copy only when the source must survive or the
+    # rename crosses filesystems
+    if os.path.abspath(working) == os.path.abspath(output_path):
+        return
+    if owned:
+        try:
+            os.replace(working, output_path)
+            return
+        except OSError:
+            pass
+    part = output_path + ".part"
+    try:
+        shutil.copyfile(working, part)
+        os.replace(part, output_path)
+    except BaseException:
+        _discard_partial(part, output_path)
+        raise
+
+def _apply_effects_sequence(input_path, output_path, timeline: List[EffectInstance], preview=False, on_progress=None, output_mode="mp4", scratch_input=False):
+    _apply_plan(input_path, output_path, _roll_timeline(timeline), preview=preview, on_progress=on_progress, output_mode=output_mode, scratch_input=scratch_input)
+
+def _apply_plan(input_path, output_path, applied, preview=False, on_progress=None, output_mode="mp4", scratch_input=False):
+    # scratch_input: input_path is a throwaway file (intro merge), so its
+    # mezzanine / analysis stay in the job temp dir instead of the shared caches
+    if output_mode not in OUTPUT_MODES:
+        raise ValueError(f"Unknown output mode {output_mode!r} (expected one of {', '.join(OUTPUT_MODES)})")
+    # Resolve and validate every step (and the encoders) before spawning any ffmpeg process
+    _venc(); _aenc()
+    steps = _fuse_plain_steps(_resolve_steps(applied, preview=preview))
     working = input_path
+    cache_input = None if scratch_input else input_path
+    final = None
     tempdir = tempfile.mkdtemp(prefix="ytpdeluxe_")
-    intermediates = []
     try:
-        for idx, (ename, level, params) in enumerate(applied):
-            meta = EFFECT_REGISTRY.get(ename)
-            if not meta:
-                continue
-            factory = meta["factory"]
-            vf, af, extras = factory(level, params, preview=preview)
-            handled_special = False
-            if extras:
-                for e in extras:
-                    # Concat-like special markers
-                    if e == "__RANDOM_CLIP_SHUFFLE__":
-                        out = os.path.join(tempdir, f"randshuffle_{idx}.mp4")
-                        clip_count = params.get("clip_count", max(4, level * 2))
-                        min_len = params.get("min_len", 0.2)
-                        max_len = params.get("max_len", 2.0)
-                        _random_clip_shuffle_impl(working, out, clip_count=clip_count, min_len=min_len, max_len=max_len, preview=preview)
-                        working = out; handled_special = True; break
-                    if e == "__RANDOM_CUTS__":
-                        out = os.path.join(tempdir, f"randcuts_{idx}.mp4")
-                        cuts = params.get("cuts", level * 10)
-                        min_len = params.get("min_len", 0.03)
-                        max_len = params.get("max_len", 0.25)
-                        _random_cuts_impl(working, out, cuts=cuts, min_len=min_len, max_len=max_len, preview=preview)
-                        working = out; handled_special = True; break
-                    if e == "__CONCAT_DELUXE__":
-                        out = os.path.join(tempdir, f"concatdeluxe_{idx}.mp4")
-                        parts = params.get("parts", max(4, level * 2))
-                        _concat_deluxe_impl(working, out, parts=parts, preview=preview)
-                        working = out; handled_special = True; break
-                    if e == "__CHAOS_TIMELINE__":
-                        out = os.path.join(tempdir, f"chaostl_{idx}.mp4")
-                        segments = params.get("segments", max(6, level * 2))
-                        _chaos_timeline_impl(working, out, segments=segments, preview=preview)
-                        working = out; handled_special = True; break
-                if handled_special:
-                    intermediates.append(working)
-                    continue
-            # Non-special: handle extras as asset dirs or explicit files
-            chosen_files = []
-            if extras:
-                for e in extras:
-                    if os.path.exists(e) and os.path.isdir(e):
-                        chosen = _choose_random_asset(e)
-                        if chosen:
-                            chosen_files.append(chosen)
-                    elif os.path.exists(e) and os.path.isfile(e):
-                        chosen_files.append(e)
-                    else:
-                        # unknown extras marker handled above or ignored
-                        pass
-            # If both chosen_files and vf present -> overlay chosen_files[0]
-            if chosen_files and vf:
-                overlay_file = chosen_files[0]
-                tmp_out = os.path.join(tempdir, f"overlay_{idx}.mp4")
-                filter_complex = "[0:v][1:v]overlay=10:10:shortest=1[vout]"
-                cmd = [FFMPEG, "-y", "-i", working, "-i", overlay_file, "-filter_complex", filter_complex, "-map", "[vout]", "-map", "0:a?", "-c:v", "libx264", "-preset", "fast", "-crf", "23", tmp_out]
-                _run_ffmpeg_blocking(cmd)
-                working = tmp_out
-                intermediates.append(working)
-                continue
-            # If chosen_files and no vf => audio injection (mix)
-            if chosen_files and not vf:
-                overlay_audio = chosen_files[0]
-                tmp_out = os.path.join(tempdir, f"audioinject_{idx}.mp4")
-                delay_ms = random.randint(0,2000)
-                cmd = [FFMPEG, "-y", "-i", working, "-i", overlay_audio, "-filter_complex", f"[1:a]adelay={delay_ms}|{delay_ms}[s1];[0:a][s1]amix=inputs=2:duration=first:dropout_transition=3[aout]", "-map", "0:v", "-map", "[aout]", "-c:v", "copy", "-c:a", "aac", "-b:a", "192k", tmp_out]
-                _run_ffmpeg_blocking(cmd)
-                working = tmp_out
-                intermediates.append(working)
-                continue
-            # Otherwise apply vf/af if present
-            tmp_out = os.path.join(tempdir, f"step_{idx}.mp4")
-            cmd = [FFMPEG, "-y", "-i", working]
-            if vf:
-                cmd += ["-vf", vf]
-            if af:
-                cmd += ["-af", af]
-            if preview:
-                cmd += ["-t", "6", "-c:v", "libx264", "-preset", "veryfast", "-crf", "28", "-c:a", "aac"]
-            else:
-                cmd += ["-c:v", "libx264", "-preset", "fast", "-crf", "23", "-c:a", "aac"]
-            cmd.append(tmp_out)
-            _run_ffmpeg_blocking(cmd)
-            working = tmp_out
-            intermediates.append(working)
-        if os.path.abspath(working) != os.path.abspath(output_path):
-            shutil.copyfile(working, output_path)
+        for n, step in enumerate(steps):
+            if output_mode != "mp4" and n == len(steps) - 1 and step.is_plain():
+                final = _progressive_target(output_path, output_mode)
+            with tracing.span(effect=step.name, step=step.idx):
+                info = _step_analysis(steps, n, input_path, None if cache_input else tempdir, preview=preview)
+                working = _render_step(step, working, cache_input, tempdir, preview=preview, final=final, analysis=info)
+        if output_mode == "mp4":
+            _deliver(working, output_path, owned=working != input_path)
+        elif final:
+            _finish_progressive(working, output_path)
+        else:
+            _remux_progressive(working, output_path, output_mode)
+    except BaseException:
+        if final:
+            _discard_partial(final[0], output_path)
+        raise
     finally:
         try:
             shutil.rmtree(tempdir)
         except Exception:
             pass
 
-def process_with_effects(input_path, output_path, timeline, on_progress=None, preview=False):
+# Journaled renders: job_dir/plan.json pins the rolled timeline, and every
+# completed step appends its output file and resolved filters to
+# job_dir/journal.jsonl (fsynced), so a rerun resumes after the last good step.
+JOB_PLAN = "plan.json"
+JOB_JOURNAL = "journal.jsonl"
+JOB_INTRO = "with_intro.mp4"
+
+def _fsync_file(path):
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+def _write_json_durable(path, data):
+    tmp = path + ".part"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+def _journal_append(job_dir, entry):
+    with open(os.path.join(job_dir, JOB_JOURNAL), "a", encoding="utf-8") as f:
+        f.write(json.dumps(entry) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+
+def _read_journal(job_dir):
+    done = {}
+    try:
+        with open(os.path.join(job_dir, JOB_JOURNAL), "r", encoding="utf-8") as f:
+            lines = f.readlines()
+    except FileNotFoundError:
+        return done
+    for line in lines:
+        try:
+            entry = json.loads(line)
+        except ValueError:
+            continue  # torn last line after a crash
+        if "truncate" in entry:
+            done = {k: v for k, v in done.items() if k < entry["truncate"]}
+        elif "step" in entry:
+            done[entry["step"]] = entry
+    return done
+
+def _load_or_create_plan(job_dir, input_path, timeline, preview=False, intro_path=None):
+    # Keyed on the user's input and intro, not on the merged file built from them
+    plan_path = os.path.join(job_dir, JOB_PLAN)
+    signature = {
+        "input": os.path.abspath(input_path),
+        "input_key": file_cache_key(input_path),
+        "intro": os.path.abspath(intro_path) if intro_path else None,
+        "intro_key": file_cache_key(intro_path) if intro_path else None,
+        "timeline": [inst.to_dict() for inst in timeline],
+        "preview": bool(preview),
+    }
+    try:
+        with open(plan_path, "r", encoding="utf-8") as f:
+            plan = json.load(f)
+        if all(plan.get(k) == v for k, v in signature.items()):
+            return [tuple(a) for a in plan["applied"]]
+    except (OSError, ValueError, KeyError):
+        pass
+    # New job (or input/timeline changed): roll a fresh plan and forget old steps
+    applied = _roll_timeline(timeline)
+    for name in (JOB_JOURNAL, JOB_INTRO):
+        try:
+            os.remove(os.path.join(job_dir, name))
+        except FileNotFoundError:
+            pass
+    _write_json_durable(plan_path, dict(signature, applied=[list(a) for a in applied]))
+    return applied
+
+def _journaled_intro(job_dir, intro_path, input_path, on_progress=None):
+    # The merged intro is a checkpoint too: built once per job, renamed into place when complete
+    merged = os.path.join(job_dir, JOB_INTRO)
+    if os.path.isfile(merged):
+        return merged
+    if on_progress:
+        on_progress("Merging intro...")
+    tmp = os.path.join(job_dir, "with_intro.part.mp4")
+    _prepend_intro(intro_path, input_path, tmp)
+    _fsync_file(tmp)
+    os.replace(tmp, merged)
+    _journal_append(job_dir, {"intro": JOB_INTRO, "size": os.path.getsize(merged)})
+    return merged
+
+def _apply_effects_journaled(input_path, output_path, timeline, job_dir, preview=False, on_progress=None, output_mode="mp4", intro_path=None):
+    os.makedirs(job_dir, exist_ok=True)
+    applied = _load_or_create_plan(job_dir, input_path, timeline, preview=preview, intro_path=intro_path)
+    _venc(); _aenc()
+    steps = _fuse_plain_steps(_resolve_steps(applied, preview=preview))
+    if intro_path:
+        input_path = _journaled_intro(job_dir, intro_path, input_path, on_progress=on_progress)
+    # The merged intro is job-scoped: keep its mezzanine / analysis in job_dir
+    cache_input = None if intro_path else input_path
+    done = _read_journal(job_dir)
+    working = input_path
+    start = 0
+    for i, step in enumerate(steps):
+        entry = done.get(i)
+        if not entry or entry.get("name") != step.name:
+            break
+        path = os.path.join(job_dir, entry["output"])
+        if not os.path.isfile(path) or os.path.getsize(path) != entry.get("size"):
+            break
+        working = path
+        start = i + 1
+    if start and on_progress:
+        on_progress(f"Resuming after step {start}/{len(steps)}")
+    _journal_append(job_dir, {"truncate": start})
+    for i in range(start, len(steps)):
+        step = steps[i]
+        if on_progress:
+            on_progress(f"Step {i + 1}/{len(steps)}: {step.name}")
+        with tracing.span(effect=step.name, step=step.idx):
+            info = _step_analysis(steps, i, input_path, None if cache_input else job_dir, preview=preview)
+            out = _render_step(step, working, cache_input, job_dir, preview=preview, analysis=info)
+        _fsync_file(out)
+        _journal_append(job_dir, {
+            "step": i, "name": step.name, "level": step.level, "params": step.params,
+            "vf": str(step.vf), "af": str(step.af), "extras": step.extras,
+            "output": os.path.basename(out), "size": os.path.getsize(out),
+        })
+        working = out
+    # Checkpoints must survive, so the final output is always a copy / remux here
+    if output_mode == "mp4":
+        _deliver(working, output_path, owned=False)
+    else:
+        _remux_progressive(working, output_path, output_mode)
+    _journal_append(job_dir, {"done": True, "output": os.path.abspath(output_path)})
+
+def _prepend_intro(intro_path, input_path, dst):
+    # Re-encoding concat: an intro rarely shares the input's codec parameters
+    cmd = [FFMPEG, "-y", "-i", intro_path, "-i", input_path,
+           "-filter_complex", "[0:v:0][0:a:0][1:v:0][1:a:0]concat=n=2:v=1:a=1[outv][outa]",
+           "-map", "[outv]", "-map", "[outa]"] + _venc("fast", 23) + _aenc("192k") + [dst]
+    with tracing.span(stage="intro"):
+        _run_ffmpeg_blocking(cmd)
+
+def _render(input_path, output_path, timeline, preview=False, on_progress=None, job_dir=None, output_mode="mp4", intro_path=None):
+    if job_dir:
+        _apply_effects_journaled(input_path, output_path, timeline, job_dir, preview=preview, on_progress=on_progress, output_mode=output_mode, intro_path=intro_path)
+        return
+    tempdir = None
+    try:
+        if intro_path:
+            tempdir = tempfile.mkdtemp(prefix="ytp_intro_")
+            merged = os.path.join(tempdir, "with_intro.mp4")
+            if on_progress:
+                on_progress("Merging intro...")
+            _prepend_intro(intro_path, input_path, merged)
+            input_path = merged
+        _apply_effects_sequence(input_path, output_path, timeline, preview=preview, on_progress=on_progress, output_mode=output_mode,
+                                scratch_input=bool(intro_path))
+    finally:
+        if tempdir:
+            shutil.rmtree(tempdir, ignore_errors=True)
+
+# Multi-variant generation: one decode of the input feeds every variant's
+# leading filter-only chain through split/asplit in a single ffmpeg process;
+# variants that continue with concat/asset steps resume from those outputs.
+# A lead that feeds RandomCuts / RandomClipShuffle is encoded all-intra in that
+# same pass (it is its own mezzanine), and the input's cached analysis is
+# carried through the lead chain instead of analysing every lead again.
+def _render_split(src, outputs, preview=False):
+    # outputs: [(vf Chain, af Chain, dst, intra), ...]
+    n = len(outputs)
+    has_audio = _has_audio(src)
+    graph = ["[0:v]split=%d%s" % (n, "".join(f"[sv{i}]" for i in range(n)))]
+    graph += [f"[sv{i}]{vf or 'null'}[ov{i}]" for i, (vf, _, _, _) in enumerate(outputs)]
+    if has_audio:
+        graph.append("[0:a]asplit=%d%s" % (n, "".join(f"[sa{i}]" for i in range(n))))
+        graph += [f"[sa{i}]{af or 'anull'}[oa{i}]" for i, (_, af, _, _) in enumerate(outputs)]
+    cmd = [FFMPEG, "-y", "-i", src, "-filter_complex", ";".join(graph)]
+    for i, (_, _, dst, intra) in enumerate(outputs):
+        cmd += ["-map", f"[ov{i}]"]
+        if has_audio:
+            cmd += ["-map", f"[oa{i}]"]
+        if preview:
+            cmd += ["-t", "6"] + _venc("veryfast", 28) + _aenc()
+        elif intra:
+            cmd += _mezzanine_video_args() + ["-c:a", "pcm_s16le"]
+        else:
+            cmd += _venc("fast", 23) + _aenc()
+        cmd.append(dst)
+    with tracing.span(stage="split"):
+        _run_ffmpeg_blocking(cmd)
+
+def _split_leading_plain(steps):
+    # Leading run of filter-only steps as one optimized (vf, af), plus the fused remainder
+    i = 0
+    vf, af = Chain(), Chain()
+    while i < len(steps) and steps[i].is_plain():
+        vf, af = vf + steps[i].vf, af + steps[i].af
+        i += 1
+    return i > 0, optimize_chain(vf), optimize_chain(af), _fuse_plain_steps(steps[i:])
+
+def _lead_intra(rest, preview=False):
+    # A lead whose output feeds a cut effect is cut many times: write it all-intra
+    return bool(rest) and not preview and any(e in CUT_MARKERS for e in rest[0].extras)
+
+def render_variants(input_path, timeline, seeds, output_template="variant_{seed}.mp4", preview=False, on_progress=None):
+    """Render one variant of timeline per seed; returns the output paths.
+
+    Each seed rolls its own plan. Identical leading filter chains are rendered
+    once and all distinct ones come out of a single split decode. Leads that
+    feed a cut effect are written all-intra in that decode and reuse the
+    input's analysis, so no variant transcodes or analyses its lead again.
+    """
+    if not os.path.exists(input_path):
+        raise FileNotFoundError("Input not found: " + input_path)
+    _venc(); _aenc()
+    variants = []
+    for i, seed in enumerate(seeds):
+        applied = _roll_timeline(timeline, random.Random(seed))
+        has_lead, vf, af, rest = _split_leading_plain(_resolve_steps(applied, preview=preview))
+        intra = _lead_intra(rest, preview=preview)
+        variants.append({"seed": seed, "out": output_template.format(seed=seed, index=i), "has_lead": has_lead,
+                         "key": (str(vf), str(af), intra), "vf": vf, "af": af, "rest": rest})
+    tempdir = tempfile.mkdtemp(prefix="ytpvariants_")
+    try:
+        leads = {}
+        for v in variants:
+            if v["has_lead"] and v["key"] not in leads:
+                intra = v["key"][2]
+                dst = os.path.join(tempdir, f"lead_{len(leads)}" + (".mkv" if intra else ".mp4"))
+                leads[v["key"]] = (v["vf"], v["af"], dst, intra)
+        if leads:
+            if on_progress:
+                on_progress(f"Rendering {len(leads)} shared chain(s) for {len(variants)} variant(s)...")
+            _render_split(input_path, list(leads.values()), preview=preview)
+        carried = {}
+        for n, v in enumerate(variants):
+            if on_progress:
+                on_progress(f"Variant {n + 1}/{len(variants)} (seed {v['seed']})")
+            working = leads[v["key"]][2] if v["has_lead"] else input_path
+            # Per-variant generator keeps the random cut / asset choices reproducible
+            rng = random.Random(v["seed"])
+            for k, step in enumerate(v["rest"]):
+                info = None
+                if k == 0 and _snaps(step):
+                    # The lead is filter-only, so the input's analysis maps onto it
+                    if v["key"] not in carried:
+                        carried[v["key"]] = _carried_analysis(input_path, v["vf"], v["af"], preview=preview)
+                    info = carried[v["key"]]
+                with tracing.span(effect=step.name, step=step.idx):
+                    working = _render_step(step, working, input_path, tempdir, preview=preview, rng=rng, analysis=info)
+            # Shared chain outputs may feed several variants, so only move what this variant owns
+            shared = sum(1 for other in variants if other["has_lead"] and other["key"] == v["key"]) > 1
+            _deliver(working, v["out"], owned=working != input_path and not (shared and not v["rest"]))
+    finally:
+        try:
+            shutil.rmtree(tempdir)
+        except Exception:
+            pass
+    return [v["out"] for v in variants]
+
+def prewarm_sounds(dirs):
+    # Decode sound assets into the sound bank ahead of a render; cheap when already cached
+    return soundbank.default_bank(FFMPEG).prewarm(dirs)
+
+def render_plan(input_path, output_path, applied, preview=False, on_progress=None):
+    """Render an already rolled plan [(name, level, params), ...] (used by segment workers)."""
+    if not os.path.exists(input_path):
+        raise FileNotFoundError("Input not found: " + input_path)
+    _apply_plan(input_path, output_path, [tuple(a) for a in applied], preview=preview, on_progress=on_progress)
+
+def process_with_effects(input_path, output_path, timeline, on_progress=None, preview=False, trace_path=None, job_dir=None, output_mode="mp4", intro_path=None):
+    """Render timeline onto input_path (prefixed with intro_path, if given).
+
+    job_dir enables a checkpointed render that a rerun with the same job_dir,
+    input and timeline resumes from the last completed step; the directory is
+    kept afterwards. Without it all intermediates live in a temp dir.
+    output_mode is one of OUTPUT_MODES ("mp4", "fmp4", "hls").
+    """
     if not os.path.exists(input_path):
         raise FileNotFoundError("Input not found: " + input_path)
-    _apply_effects_sequence(input_path, output_path, timeline, preview=preview, on_progress=on_progress)
\ No newline at end of file
+    if intro_path and not os.path.exists(intro_path):
+        raise FileNotFoundError("Intro not found: " + intro_path)
+    if not trace_path:
+        _render(input_path, output_path, timeline, preview=preview, on_progress=on_progress, job_dir=job_dir, output_mode=output_mode, intro_path=intro_path)
+        return
+    # Chrome-trace / Perfetto JSON at trace_path plus a per-effect summary table next to it
+    tracer = tracing.Tracer(name=os.path.basename(input_path))
+    try:
+        with tracing.trace_job(tracer):
+            _render(input_path, output_path, timeline, preview=preview, on_progress=on_progress, job_dir=job_dir, output_mode=output_mode, intro_path=intro_path)
+    finally:
+        tracer.write_chrome_trace(trace_path)
+        tracer.write_summary(os.path.splitext(trace_path)[0] + "_summary.txt")
+
+# Live preview: only filter-only steps can be streamed; reverse needs the whole
+# clip buffered before its first frame, so it is left out as well.
+LIVE_PREVIEW_SKIP = {"reverse", "areverse"}
+
+def stream_preview(input_path, timeline, on_frame, width=320, duration=None, stop_event=None, on_progress=None):
+    """Pipe downscaled rgb24 frames of the filter chain to on_frame(w, h, data).
+
+    Nothing is written to disk. Concat / asset steps cannot be streamed and are
+    skipped (reported through on_progress). Returns the number of frames sent.
+    """
+    if not os.path.exists(input_path):
+        raise FileNotFoundError("Input not found: " + input_path)
+    steps = _resolve_steps(_roll_timeline(timeline), preview=True)
+    vf = Chain()
+    skipped = []
+    for step in steps:
+        if step.is_plain():
+            vf = vf + Chain(f for f in step.vf if f.name not in LIVE_PREVIEW_SKIP)
+        else:
+            skipped.append(step.name)
+    if skipped and on_progress:
+        on_progress("Live preview skips: " + ", ".join(skipped))
+    src_w, src_h = _probe_video_size(input_path)
+    if src_w <= 0 or src_h <= 0:
+        raise RuntimeError("Cannot probe video size for source.")
+    w = max(2, width - width % 2)
+    h = max(2, int(round(w * src_h / src_w / 2.0)) * 2)
+    # Final scale pins the frame size whatever the chain does to geometry
+    vf = optimize_chain(vf) + Chain.parse(f"scale={w}:{h}")
+    cmd = [FFMPEG, "-hide_banner", "-loglevel", "error", "-re", "-i", input_path]
+    if duration:
+        cmd += ["-t", str(duration)]
+    cmd += ["-an", "-vf", str(vf), "-f", "rawvideo", "-pix_fmt", "rgb24", "pipe:1"]
+    frame_size = w * h * 3
+    frames = 0
+    with tracing.span(stage="live_preview"), tracing.stream(cmd, bufsize=frame_size) as proc:
+        while stop_event is None or not stop_event.is_set():
+            data = proc.stdout.read(frame_size)
+            if len(data) < frame_size:
+                break
+            on_frame(w, h, data)
+            frames += 1
+    if frames == 0 and proc.returncode not in (0, None) and not (stop_event and stop_event.is_set()):
+        err = proc.stderr.read().decode("utf-8", errors="replace")
+        raise RuntimeError(f"ffmpeg live preview failed (rc={proc.returncode}):\n{err}")
+    return frames
@@ -0,0 +1,246 @@
+"""
+Small typed IR for ffmpeg filter chains.
+
+Effect factories return Chain objects instead of raw strings. The backend
+fuses consecutive filter-only steps into one chain, runs optimize() to cancel
+inverse pairs (hflip+hflip, reverse+reverse, ...), merge setpts/atempo factors
+and drop no-ops, and validate()s every chain before any ffmpeg process is
+spawned so a malformed graph fails immediately.
+"""
+import re
+from dataclasses import dataclass
+from typing import Iterable, Optional
+
+class FilterGraphError(ValueError):
+    pass
+
+# Filters that undo themselves when applied twice in a row
+INVOLUTIONS = {"hflip", "vflip", "negate", "reverse", "areverse"}
+NO_OPS = {"null", "anull", "copy", "acopy"}
+
+_RE_NAME = re.compile(r"^[A-Za-z0-9_]+$")
+_RE_SETPTS = re.compile(r"^PTS(?:\s*([*/])\s*([0-9]*\.?[0-9]+(?:[eE][-+]?[0-9]+)?))?$")
+_RE_NUMBER = re.compile(r"^[0-9]*\.?[0-9]+(?:[eE][-+]?[0-9]+)?$")
+
+@dataclass(frozen=True)
+class Filter:
+    name: str
+    args: str = ""
+
+    def __str__(self):
+        return f"{self.name}={self.args}" if self.args else self.name
+
+class Chain(list):
+    """A linear filter chain; str() renders it for -vf / -af."""
+
+    def __str__(self):
+        return ",".join(str(f) for f in self)
+
+    def __add__(self, other):
+        return Chain(list.__add__(self, Chain.coerce(other)))
+
+    @staticmethod
+    def coerce(value):
+        # Accept None, a Chain, a list of Filters or a legacy filter string
+        if value is None:
+            return Chain()
+        if isinstance(value, Chain):
+            return value
+        if isinstance(value, str):
+            return Chain.parse(value)
+        return Chain(value)
+
+    @staticmethod
+    def parse(text):
+        chain = Chain()
+        if not text.strip():
+            return chain
+        for part in _split_top_level(text):
+            part = part.strip()
+            if not part:
+                raise FilterGraphError(f"Empty filter in chain: {text!r}")
+            name, _, args = part.partition("=")
+            chain.append(Filter(name.strip(), args))
+        return chain
+
+def chain(*specs):
+    # chain("hflip", ("setpts", "PTS/2")) -> Chain
+    out = Chain()
+    for spec in specs:
+        if isinstance(spec, Filter):
+            out.append(spec)
+        elif isinstance(spec, tuple):
+            out.append(Filter(*spec))
+        else:
+            out.append(Filter(spec))
+    return out
+
+def _split_top_level(text):
+    # Split on commas that are not quoted, escaped or inside brackets
+    parts, buf, depth, quoted, escaped = [], [], 0, False, False
+    for ch in text:
+        if escaped:
+            buf.append(ch); escaped = False; continue
+        if ch == "\\":
+            buf.append(ch); escaped = True; continue
+        if ch == "'":
+            quoted = not quoted
+        elif not quoted and ch in "([":
+            depth += 1
+        elif not quoted and ch in ")]":
+            depth -= 1
+        elif ch == "," and not quoted and depth == 0:
+            parts.append("".join(buf)); buf = []; continue
+        buf.append(ch)
+    parts.append("".join(buf))
+    return parts
+
+def atempo_factors(x):
+    # atempo accepts 0.5..2.0 per instance; split larger changes into a chain
+    parts = []
+    while x > 2.0:
+        parts.append(2.0)
+        x /= 2.0
+    while x < 0.5:
+        parts.append(0.5)
+        x /= 0.5
+    if abs(x - 1.0) > 1e-6:
+        parts.append(x)
+    if not parts:
+        parts = [1.0]
+    return parts
+
+def atempo_chain(x):
+    return Chain(Filter("atempo", f"{f:.6f}") for f in atempo_factors(x))
+
+def _setpts_multiplier(f):
+    # setpts=PTS*m / PTS/d / PTS -> m, anything else (expressions) -> None
+    m = _RE_SETPTS.match(f.args.replace(" ", ""))
+    if not m:
+        return None
+    if m.group(1) is None:
+        return 1.0
+    value = float(m.group(2))
+    if value == 0:
+        return None
+    return value if m.group(1) == "*" else 1.0 / value
+
+def _number(args, key):
+    # Plain numeric argument, optionally given as key=value
+    if args.startswith(key + "="):
+        args = args[len(key) + 1:]
+    return float(args) if _RE_NUMBER.match(args) else None
+
+def _atempo_factor(f):
+    return _number(f.args, "tempo")
+
+def _is_no_op(f):
+    if f.name in NO_OPS:
+        return True
+    if f.name == "setpts":
+        v = _setpts_multiplier(f)
+    elif f.name == "atempo":
+        v = _atempo_factor(f)
+    elif f.name == "volume":
+        v = _number(f.args, "volume")
+    else:
+        return False
+    return v is not None and abs(v - 1.0) < 1e-9
+
+def optimize(value):
+    out = Chain()
+    for f in Chain.coerce(value):
+        if _is_no_op(f):
+            continue
+        prev = out[-1] if out else None
+        if prev is not None and f.name in INVOLUTIONS and prev == f and not f.args:
+            out.pop()
+            continue
+        if prev is not None and f.name == prev.name == "setpts":
+            a, b = _setpts_multiplier(prev), _setpts_multiplier(f)
+            if a is not None and b is not None:
+                out.pop()
+                merged = Filter("setpts", f"PTS/{1.0 / (a * b):.6f}")
+                if not _is_no_op(merged):
+                    out.append(merged)
+                continue
+        if prev is not None and f.name == prev.name == "atempo":
+            a, b = _atempo_factor(prev), _atempo_factor(f)
+            if a is not None and b is not None:
+                out.pop()
+                merged = Filter("atempo", repr(a * b))
+                if not _is_no_op(merged):
+                    out.append(merged)
+                continue
+        out.append(f)
+    # Re-split merged atempo factors into the range the filter accepts
+    final = Chain()
+    for f in out:
+        factor = _atempo_factor(f) if f.name == "atempo" else None
+        if factor is not None and not 0.5 <= factor <= 2.0:
+            final.extend(atempo_chain(factor))
+        elif factor is not None:
+            final.append(Filter("atempo", f"{factor:.6f}"))
+        else:
+            final.append(f)
+    return final
+
+# Filters that leave every frame / sample at its timestamp
+TIMING_NEUTRAL = {"hflip", "vflip", "negate", "scale", "format", "fps", "null", "copy",
+                  "volume", "aecho", "aresample", "anull", "acopy"}
+
+def time_map(value, duration):
+    """Function mapping input timestamps to output timestamps of a linear chain.
+
+    Follows setpts=PTS*k, atempo and reverse/areverse; returns None if the
+    chain retimes in any other way.
+    """
+    ops = []
+    for f in Chain.coerce(value):
+        if f.name in TIMING_NEUTRAL:
+            continue
+        if f.name == "setpts":
+            m = _setpts_multiplier(f)
+        elif f.name == "atempo":
+            m = _atempo_factor(f)
+            m = 1.0 / m if m else None
+        elif f.name in ("reverse", "areverse"):
+            ops.append((-1.0, duration))
+            continue
+        else:
+            return None
+        if m is None:
+            return None
+        ops.append((m, 0.0))
+        duration *= m
+
+    def apply(t):
+        for m, offset in ops:
+            t = offset + m * t
+        return t
+    return apply
+
+def validate(value, available: Optional[Iterable[str]] = None, label="filter chain"):
+    # Structural check (names, quotes, brackets) plus optional known-filter check
+    known = set(available) if available is not None else None
+    for f in Chain.coerce(value):
+        if not _RE_NAME.match(f.name or ""):
+            raise FilterGraphError(f"{label}: invalid filter name {f.name!r}")
+        if known is not None and f.name not in known:
+            raise FilterGraphError(f"{label}: filter {f.name!r} is not available in this ffmpeg build")
+        depth, quoted, escaped = 0, False, False
+        for ch in f.args:
+            if escaped:
+                escaped = False
+            elif ch == "\\":
+                escaped = True
+            elif ch == "'":
+                quoted = not quoted
+            elif not quoted and ch in "([":
+                depth += 1
+            elif not quoted and ch in ")]":
+                depth -= 1
+                if depth < 0:
+                    break
+        if quoted or depth != 0:
+            raise FilterGraphError(f"{label}: unbalanced quotes or brackets in {str(f)!r}")
@@ -2,16 +2,16 @@ import os
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
 import threading
+import queue
 import random
 import json
-import tempfile
-import subprocess
-import shutil
 
 from effects import EFFECT_REGISTRY, EffectInstance
-from ffmpeg_backend import process_with_effects, check_ffmpeg
+from ffmpeg_backend import process_with_effects, check_ffmpeg, stream_preview, prewarm_sounds
 
 CONFIG_PATH = "config.json"
+UI_POLL_MS = 15
+LIVE_PREVIEW_WIDTH = 480
 
 class YTPPlusGUI:
     def __init__(self):
@@ -41,9 +41,20 @@ class YTPPlusGUI:
         self.concat_deluxe_var = tk.BooleanVar(value=False)
         self.random_clip_shuffle_var = tk.BooleanVar(value=False)
         self.random_cuts_var = tk.BooleanVar(value=False)
+        self.trace_var = tk.BooleanVar(value=False)
+        self.resumable_var = tk.BooleanVar(value=False)
 
         self.timeline = []  # list of EffectInstance
 
+        # Worker threads never touch Tk directly: they queue callables that the
+        # main loop runs, and live-preview frames go through a latest-frame slot.
+        self._ui_queue = queue.Queue()
+        self._live_frame = None
+        self._live_window = None
+        self._live_label = None
+        self._live_photo = None
+        self._live_stop = None
+
         self.build_ui()
         self.load_config()
 
@@ -74,6 +85,8 @@ class YTPPlusGUI:
         ttk.Checkbutton(options_frm, text="Concat Deluxe", variable=self.concat_deluxe_var).grid(row=0, column=1, sticky=tk.W, padx=4)
         ttk.Checkbutton(options_frm, text="Random Clip Shuffle", variable=self.random_clip_shuffle_var).grid(row=0, column=2, sticky=tk.W, padx=4)
         ttk.Checkbutton(options_frm, text="Random Cuts", variable=self.random_cuts_var).grid(row=0, column=3, sticky=tk.W, padx=4)
+        ttk.Checkbutton(options_frm, text="Write Trace", variable=self.trace_var).grid(row=0, column=4, sticky=tk.W, padx=4)
+        ttk.Checkbutton(options_frm, text="Resumable Render", variable=self.resumable_var).grid(row=0, column=5, sticky=tk.W, padx=4)
 
         # Meme / Sound options
         assets_frm = ttk.LabelFrame(frm, text="Memes & Sounds", padding=6)
@@ -148,6 +161,7 @@ class YTPPlusGUI:
         render_frm.pack(fill=tk.X)
         ttk.Button(render_frm, text="Render (Process)", command=self.render).pack(side=tk.LEFT)
         ttk.Button(render_frm, text="Preview (small)", command=self.preview).pack(side=tk.LEFT, padx=6)
+        ttk.Button(render_frm, text="Live Preview", command=self.live_preview).pack(side=tk.LEFT)
         ttk.Button(render_frm, text="Save Config", command=self.save_config).pack(side=tk.RIGHT)
 
         # status
@@ -263,39 +277,24 @@ class YTPPlusGUI:
         if not output_path:
             messagebox.showerror("Missing output", "Please select an output file.")
             return
-        t = threading.Thread(target=self._render_thread, args=(input_path, output_path, False))
+        t = threading.Thread(target=self._render_thread, args=(input_path, output_path, False, self._snapshot_options()))
         t.start()
 
-    def _render_thread(self, input_path, output_path, preview_flag):
+    def _render_thread(self, input_path, output_path, preview_flag, opts):
         try:
-            self.set_status("Preparing timeline...")
-            timeline_copy = self._build_timeline_for_render()
-            # handle intro if provided -> create working input
-            working_input = input_path
-            tempdir = None
-            if self.intro_path_var.get():
-                tempdir = tempfile.mkdtemp(prefix="ytp_intro_")
-                tmp_with_intro = os.path.join(tempdir, "with_intro.mp4")
-                try:
-                    self.set_status("Merging intro...")
-                    self._reencode_concat([self.intro_path_var.get(), input_path], tmp_with_intro)
-                    working_input = tmp_with_intro
-                except Exception as e:
-                    shutil.rmtree(tempdir, ignore_errors=True)
-                    raise
+            if opts["sound_dirs"]:
+                self.set_status("Preparing sound bank...")
+                prewarm_sounds(opts["sound_dirs"])
             self.set_status("Rendering...")
-            process_with_effects(working_input, output_path, timeline_copy, on_progress=self.set_status, preview=preview_flag)
+            trace_path = os.path.splitext(output_path)[0] + "_trace.json" if opts["trace"] else None
+            job_dir = os.path.splitext(output_path)[0] + "_job" if opts["resumable"] else None
+            process_with_effects(input_path, output_path, opts["timeline"], on_progress=self.set_status, preview=preview_flag,
+                                 trace_path=trace_path, job_dir=job_dir, intro_path=opts["intro"])
             self.set_status(f"Done: {output_path}")
-            messagebox.showinfo("Render complete", f"Rendered to {output_path}")
+            self._call_in_ui(messagebox.showinfo, "Render complete", f"Rendered to {output_path}")
         except Exception as e:
             self.set_status("Error during render")
-            messagebox.showerror("Render error", str(e))
-        finally:
-            if 'tempdir' in locals() and tempdir:
-                try:
-                    shutil.rmtree(tempdir)
-                except Exception:
-                    pass
+            self._call_in_ui(messagebox.showerror, "Render error", str(e))
 
     def preview(self):
         input_path = self.input_path_var.get()
@@ -303,22 +302,92 @@ class YTPPlusGUI:
             messagebox.showerror("Missing input", "Please select an input file.")
             return
         preview_output = os.path.splitext(self.output_path_var.get())[0] + "_preview.mp4"
-        t = threading.Thread(target=self._preview_thread, args=(input_path, preview_output))
+        t = threading.Thread(target=self._preview_thread, args=(input_path, preview_output, self._build_timeline_for_render()))
         t.start()
 
-    def _preview_thread(self, input_path, preview_output):
+    def _preview_thread(self, input_path, preview_output, timeline_copy):
         try:
-            self.set_status("Building preview timeline...")
-            timeline_copy = self._build_timeline_for_render()
             self.set_status("Rendering preview...")
             process_with_effects(input_path, preview_output, timeline_copy, on_progress=self.set_status, preview=True)
             self.set_status(f"Preview done: {preview_output}")
-            messagebox.showinfo("Preview complete", f"Preview written to {preview_output}")
+            self._call_in_ui(messagebox.showinfo, "Preview complete", f"Preview written to {preview_output}")
         except Exception as e:
             self.set_status("Error during preview")
-            messagebox.showerror("Preview error", str(e))
+            self._call_in_ui(messagebox.showerror, "Preview error", str(e))
+
+    # --- Live preview (frames piped from ffmpeg, nothing written to disk) ---
+    def live_preview(self):
+        input_path = self.input_path_var.get()
+        if not input_path:
+            messagebox.showerror("Missing input", "Please select an input file.")
+            return
+        self.stop_live_preview()
+        self._live_window = tk.Toplevel(self.root)
+        self._live_window.title("Live Preview")
+        self._live_window.protocol("WM_DELETE_WINDOW", self.stop_live_preview)
+        self._live_label = ttk.Label(self._live_window, text="Starting...")
+        self._live_label.pack(fill=tk.BOTH, expand=True)
+        self._live_stop = threading.Event()
+        t = threading.Thread(target=self._live_preview_thread, args=(input_path, self._build_timeline_for_render(), self._live_stop), daemon=True)
+        t.start()
+
+    def _live_preview_thread(self, input_path, timeline_copy, stop_event):
+        try:
+            self.set_status("Live preview...")
+            frames = stream_preview(input_path, timeline_copy, self._on_live_frame, width=LIVE_PREVIEW_WIDTH,
+                                    stop_event=stop_event, on_progress=self.set_status)
+            if not stop_event.is_set():
+                self.set_status(f"Live preview finished ({frames} frames)")
+        except Exception as e:
+            self.set_status("Error during live preview")
+            self._call_in_ui(messagebox.showerror, "Live preview error", str(e))
+
+    def _on_live_frame(self, w, h, data):
+        # Called on the worker thread; only the newest frame is kept
+        self._live_frame = (w, h, data)
+
+    def _show_live_frame(self):
+        frame, self._live_frame = self._live_frame, None
+        if frame is None or self._live_label is None:
+            return
+        w, h, data = frame
+        ppm = f"P6 {w} {h} 255 ".encode("ascii") + data
+        self._live_photo = tk.PhotoImage(data=ppm, format="PPM")
+        self._live_label.configure(image=self._live_photo, text="")
+
+    def stop_live_preview(self):
+        if self._live_stop is not None:
+            self._live_stop.set()
+            self._live_stop = None
+        if self._live_window is not None:
+            try:
+                self._live_window.destroy()
+            except tk.TclError:
+                pass
+        self._live_window = None
+        self._live_label = None
+        self._live_photo = None
+        self._live_frame = None
+
+    def _snapshot_options(self):
+        # Everything a render thread needs, read from the Tk variables on the main thread
+        sound_dirs = []
+        if self.use_sounds_var.get():
+            sound_dirs.append(self.sounds_dir_var.get())
+        if self.use_xp_var.get():
+            sound_dirs.append(self.xp_sounds_dir_var.get())
+        if self.use_memes_var.get():
+            sound_dirs.append(self.memes_dir_var.get())
+        return {
+            "timeline": self._build_timeline_for_render(),
+            "intro": self.intro_path_var.get() or None,
+            "sound_dirs": sound_dirs,
+            "trace": self.trace_var.get(),
+            "resumable": self.resumable_var.get(),
+        }
 
     def _build_timeline_for_render(self):
+        # Reads Tk variables: call on the main thread only
         # start with user timeline items
         tlist = [EffectInstance(name=inst.name, probability=inst.probability, max_level=inst.max_level, params=dict(inst.params or {}), enabled=inst.enabled) for inst in self.timeline]
         # add quick options selected from the GUI
@@ -343,21 +412,6 @@ class YTPPlusGUI:
                 tlist.append(EffectInstance(name="AddRandomSound", probability=95, max_level=5, params={"sounds_dir": self.xp_sounds_dir_var.get()}))
         return tlist
 
-    def _reencode_concat(self, files, out_path):
-        if not files:
-            raise ValueError("No files to concat")
-        cmd = ["ffmpeg", "-y"]
-        for f in files:
-            cmd += ["-i", f]
-        n = len(files)
-        v_inputs = "".join([f"[{i}:v:0]" for i in range(n)])
-        a_inputs = "".join([f"[{i}:a:0]" for i in range(n)])
-        filter_complex = f"{v_inputs}{a_inputs}concat=n={n}:v=1:a=1[outv][outa]"
-        cmd += ["-filter_complex", filter_complex, "-map", "[outv]", "-map", "[outa]",
-                "-c:v", "libx264", "-preset", "fast", "-crf", "23", "-c:a", "aac", "-b:a", "192k",
-                out_path]
-        subprocess.run(cmd, check=True)
-
     # --- Config save/load / status ---
     def save_config(self):
         data = {
@@ -376,6 +430,8 @@ class YTPPlusGUI:
             "min_stream": self.min_stream_var.get(),
             "max_stream": self.max_stream_var.get(),
             "clip_count": self.clip_count_var.get(),
+            "trace": self.trace_var.get(),
+            "resumable": self.resumable_var.get(),
             "timeline": [inst.to_dict() for inst in self.timeline]
         }
         with open(CONFIG_PATH, "w", encoding="utf-8") as f:
@@ -403,6 +459,8 @@ class YTPPlusGUI:
             self.min_stream_var.set(data.get("min_stream", 0.2))
             self.max_stream_var.set(data.get("max_stream", 2.0))
             self.clip_count_var.set(data.get("clip_count", 6))
+            self.trace_var.set(data.get("trace", False))
+            self.resumable_var.set(data.get("resumable", False))
             for it in data.get("timeline", []):
                 inst = EffectInstance.from_dict(it)
                 self.timeline.append(inst)
@@ -412,10 +470,32 @@ class YTPPlusGUI:
             self.set_status("Failed to load config")
 
     def set_status(self, msg):
+        if threading.current_thread() is not threading.main_thread():
+            self._call_in_ui(self.set_status, msg)
+            return
         try:
             self.status_var.set(str(msg))
         except Exception:
             pass
 
+    # --- Thread-safe UI marshalling ---
+    def _call_in_ui(self, fn, *args):
+        self._ui_queue.put((fn, args))
+
+    def _pump_ui(self):
+        try:
+            while True:
+                fn, args = self._ui_queue.get_nowait()
+                try:
+                    fn(*args)
+                except Exception:
+                    pass
+        except queue.Empty:
+            pass
+        self._show_live_frame()
+        self.root.after(UI_POLL_MS, self._pump_ui)
+
     def run(self):
-        self.root.mainloop()
\ No newline at end of file
+        self.root.after(UI_POLL_MS, self._pump_ui)
+        self.root.mainloop()
+        self.stop_live_preview()
\ No newline at end of file
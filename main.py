@@ -2,15 +2,81 @@
 """
 Entry point with GUI or batch CLI.
 
-This is a small wrapper; batch CLI already supported (see earlier main.py).
-No change to CLI semantics here; leaving as-is. Run "python main.py --help" for options.
+Without arguments the Tkinter GUI starts. With --input the render runs
+headless using the timeline from --config (default config.json). Heavy
+modules (tkinter, the backend) are imported lazily so headless runs never
+load Tk. Run "python main.py --help" for options.
 """
 import sys
-from gui import YTPPlusGUI
 
-def main():
-    app = YTPPlusGUI()
-    app.run()
+def run_batch(args):
+    import json
+    import os
+    from effects import EffectInstance
+    from ffmpeg_backend import process_with_effects, check_ffmpeg
+
+    if not check_ffmpeg():
+        print("ffmpeg binary not found in PATH. Install ffmpeg and add it to PATH.", file=sys.stderr)
+        return 2
+    try:
+        with open(args.config, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"Cannot read config {args.config}: {e}", file=sys.stderr)
+        return 2
+    timeline = [EffectInstance.from_dict(it) for it in data.get("timeline", [])]
+    output = args.output or data.get("output") or "output.mp4"
+    trace_path = os.path.splitext(output)[0] + "_trace.json" if args.trace else None
+    if args.seeds:
+        from ffmpeg_backend import render_variants
+        base, ext = os.path.splitext(output)
+        seeds = [int(x) for x in args.seeds.split(",") if x.strip()]
+        for path in render_variants(args.input, timeline, seeds, output_template=base + "_{seed}" + ext, preview=args.preview, on_progress=print):
+            print(f"Done: {path}")
+        return 0
+    if args.workers:
+        from distributed import render_distributed, parse_address
+        workers = [parse_address(w) for w in args.workers.split(",") if w.strip()]
+        render_distributed(args.input, output, timeline, workers, segments=args.segments, preview=args.preview, on_progress=print)
+    else:
+        process_with_effects(args.input, output, timeline, on_progress=print, preview=args.preview, trace_path=trace_path, job_dir=args.job_dir, output_mode=args.output_mode)
+    print(f"Done: {output}")
+    return 0
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if not argv:
+        from gui import YTPPlusGUI
+        app = YTPPlusGUI()
+        app.run()
+        return 0
+    import argparse
+    parser = argparse.ArgumentParser(description="YTP+ Deluxe Fan Edition")
+    parser.add_argument("--input", required=True, help="input video")
+    parser.add_argument("--output", help="output path (default: config output)")
+    parser.add_argument("--config", default="config.json", help="config with the effect timeline")
+    parser.add_argument("--preview", action="store_true", help="short low-quality preview render")
+    parser.add_argument("--trace", action="store_true", help="write <output>_trace.json and a summary table")
+    parser.add_argument("--job-dir", help="checkpoint directory; rerunning with it resumes an interrupted render")
+    parser.add_argument("--workers", help="comma-separated host:port segment workers (see distributed.py)")
+    parser.add_argument("--segments", type=int, help="number of time segments for --workers (default 2 per worker)")
+    parser.add_argument("--output-mode", choices=("mp4", "fmp4", "hls"), default="mp4",
+                        help="mp4 (default), fragmented mp4 readable while rendering, or an HLS playlist (use a .m3u8 output)")
+    parser.add_argument("--seeds", help="comma-separated seeds: render one variant per seed as <output>_<seed>")
+    args = parser.parse_args(argv)
+    # Variant and distributed renders have their own delivery path
+    for flag, value in (("--seeds", args.seeds), ("--workers", args.workers)):
+        if not value:
+            continue
+        if args.seeds and args.workers:
+            parser.error("--seeds and --workers cannot be combined")
+        if args.output_mode != "mp4":
+            parser.error(f"--output-mode {args.output_mode} is not supported with {flag}")
+        if args.trace or args.job_dir:
+            parser.error(f"--trace and --job-dir are not supported with {flag}")
+    if args.workers and args.preview:
+        parser.error("--preview cannot be combined with --workers (each segment would be cut to a preview clip)")
+    return run_batch(args)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    sys.exit(main())
@@ -0,0 +1,111 @@
+"""
+Decoded sound-bank cache for AddRandomSound / XP sounds / meme audio.
+
+Each audio asset is decoded once to raw PCM at the pipeline sample rate
+(s16le, stereo), loudness-normalized with loudnorm, and stored in the cache
+keyed by the asset's path/size/mtime. Injections feed that PCM straight to
+ffmpeg as a raw input, so no per-injection decode or resample is needed.
+Entries are evicted least-recently-used (by mtime, refreshed on every hit)
+once the bank grows past max_bytes. Entries used within the last few minutes
+are never evicted, since another render may be about to open them.
+"""
+import os
+import glob
+import tempfile
+import threading
+import subprocess
+
+import tracing
+from utils import cache_dir, file_cache_key, evict_lru
+
+PIPELINE_SAMPLE_RATE = 44100
+PIPELINE_CHANNELS = 2
+SAMPLE_FORMAT = "s16le"
+AUDIO_EXTS = (".mp3", ".wav", ".m4a", ".ogg")
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+LOUDNORM = "loudnorm=I=-16:TP=-1.5:LRA=11"
+# Seconds since last use before an entry may be evicted
+EVICT_MIN_AGE = 300.0
+
+class SoundBank:
+    def __init__(self, directory=None, max_bytes=DEFAULT_MAX_BYTES, sample_rate=PIPELINE_SAMPLE_RATE,
+                 channels=PIPELINE_CHANNELS, ffmpeg="ffmpeg"):
+        self.directory = directory or cache_dir("soundbank")
+        self.max_bytes = max_bytes
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.ffmpeg = ffmpeg
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def is_audio(path):
+        return os.path.splitext(path)[1].lower() in AUDIO_EXTS
+
+    def _entry_path(self, src):
+        return os.path.join(self.directory, f"{file_cache_key(src)}_{self.sample_rate}_{self.channels}.pcm")
+
+    def _decode(self, src, dst):
+        # Unique temp name: concurrent decodes of one asset must not share a file
+        fd, tmp = tempfile.mkstemp(suffix=".part", dir=self.directory)
+        os.close(fd)
+        cmd = [self.ffmpeg, "-y", "-i", src, "-vn", "-af", LOUDNORM,
+               "-ar", str(self.sample_rate), "-ac", str(self.channels), "-f", SAMPLE_FORMAT, tmp]
+        try:
+            with tracing.span(stage="soundbank"):
+                tracing.run(cmd)
+            os.replace(tmp, dst)
+        except subprocess.CalledProcessError as e:
+            raise RuntimeError(f"ffmpeg failed to decode sound {src} (rc={e.returncode}):\n{e.stderr}") from e
+        finally:
+            if os.path.exists(tmp):
+                try:
+                    os.remove(tmp)
+                except Exception:
+                    pass
+
+    def get(self, src):
+        """Path of the cached PCM for src, decoding it on first use."""
+        dst = self._entry_path(src)
+        if os.path.exists(dst):
+            try:
+                os.utime(dst)  # LRU: mtime doubles as last-access time
+            except OSError:
+                pass
+            return dst
+        self._decode(src, dst)
+        self.evict(keep=dst)
+        return dst
+
+    def input_args(self, src):
+        # ffmpeg input arguments that read the cached PCM instead of decoding src
+        return ["-f", SAMPLE_FORMAT, "-ar", str(self.sample_rate), "-ac", str(self.channels), "-i", self.get(src)]
+
+    def prewarm(self, dirs):
+        # Decode every audio asset in dirs ahead of a render; returns how many are cached
+        count = 0
+        for d in dirs:
+            if not d or not os.path.isdir(d):
+                continue
+            for path in sorted(glob.glob(os.path.join(d, "*"))):
+                if os.path.isfile(path) and self.is_audio(path):
+                    try:
+                        self.get(path)
+                        count += 1
+                    except RuntimeError:
+                        pass
+        return count
+
+    def evict(self, keep=None):
+        with self._lock:
+            evict_lru(self.directory, ".pcm", self.max_bytes, keep=keep, min_age=EVICT_MIN_AGE)
+
+_default_bank = None
+_default_lock = threading.Lock()
+
+def default_bank(ffmpeg="ffmpeg"):
+    global _default_bank
+    with _default_lock:
+        if _default_bank is None:
+            max_bytes = int(os.environ.get("YTP_SOUNDBANK_MAX_BYTES", DEFAULT_MAX_BYTES))
+            _default_bank = SoundBank(max_bytes=max_bytes, ffmpeg=ffmpeg)
+        return _default_bank
@@ -0,0 +1,228 @@
+"""
+Per-invocation tracing for ffmpeg / ffprobe processes.
+
+Every external process goes through run() (or stream() for piped output). When a Tracer is active for the
+current job (trace_job), each call is recorded with its argv, the effect /
+step / stage it came from, wall and CPU time (child rusage), peak RSS and
+input/output bytes. A job trace can be written as Chrome-trace / Perfetto
+JSON and summarised per effect.
+"""
+import os
+import sys
+import json
+import time
+import threading
+import subprocess
+import contextvars
+from contextlib import contextmanager
+from dataclasses import dataclass, asdict
+from typing import List, Optional
+
+_current_tracer = contextvars.ContextVar("ytp_tracer", default=None)
+_current_span = contextvars.ContextVar("ytp_span", default={})
+
+@dataclass
+class TraceRecord:
+    argv: List[str]
+    start: float
+    wall_s: float
+    returncode: int
+    effect: Optional[str] = None
+    step: Optional[int] = None
+    stage: Optional[str] = None
+    cpu_user_s: Optional[float] = None
+    cpu_sys_s: Optional[float] = None
+    peak_rss_kb: Optional[int] = None
+    input_bytes: int = 0
+    output_bytes: int = 0
+    thread: int = 0
+
+class Tracer:
+    def __init__(self, name="render"):
+        self.name = name
+        self.t0 = time.time()
+        self.records: List[TraceRecord] = []
+        self._lock = threading.Lock()
+        self._threads = {}
+
+    def add(self, record):
+        with self._lock:
+            record.thread = self._threads.setdefault(threading.get_ident(), len(self._threads) + 1)
+            self.records.append(record)
+
+    def summary(self):
+        # One row per effect: calls, wall, cpu, peak RSS and bytes moved
+        rows = {}
+        for r in self.records:
+            key = r.effect or "(pipeline)"
+            row = rows.setdefault(key, {"effect": key, "calls": 0, "wall_s": 0.0, "cpu_s": 0.0,
+                                        "peak_rss_kb": 0, "input_bytes": 0, "output_bytes": 0})
+            row["calls"] += 1
+            row["wall_s"] += r.wall_s
+            row["cpu_s"] += (r.cpu_user_s or 0.0) + (r.cpu_sys_s or 0.0)
+            row["peak_rss_kb"] = max(row["peak_rss_kb"], r.peak_rss_kb or 0)
+            row["input_bytes"] += r.input_bytes
+            row["output_bytes"] += r.output_bytes
+        return sorted(rows.values(), key=lambda row: row["wall_s"], reverse=True)
+
+    def format_summary(self):
+        header = f"{'effect':<40} {'calls':>5} {'wall s':>9} {'cpu s':>9} {'rss MB':>8} {'in MB':>9} {'out MB':>9}"
+        lines = [header, "-" * len(header)]
+        mb = 1024.0 * 1024.0
+        for row in self.summary():
+            lines.append(
+                f"{row['effect'][:40]:<40} {row['calls']:>5} {row['wall_s']:>9.2f} {row['cpu_s']:>9.2f} "
+                f"{row['peak_rss_kb'] / 1024.0:>8.1f} {row['input_bytes'] / mb:>9.1f} {row['output_bytes'] / mb:>9.1f}"
+            )
+        return "\n".join(lines)
+
+    def to_chrome_trace(self):
+        pid = os.getpid()
+        events = [{"name": "process_name", "ph": "M", "pid": pid, "args": {"name": self.name}}]
+        for r in self.records:
+            label = r.effect or "pipeline"
+            if r.stage:
+                label += ":" + r.stage
+            args = asdict(r)
+            args["argv"] = " ".join(r.argv)
+            events.append({
+                "name": f"{label} ({os.path.basename(r.argv[0])})",
+                "cat": "ffmpeg",
+                "ph": "X",
+                "ts": int((r.start - self.t0) * 1e6),
+                "dur": int(r.wall_s * 1e6),
+                "pid": pid,
+                "tid": r.thread,
+                "args": args,
+            })
+        return {"traceEvents": events, "displayTimeUnit": "ms", "otherData": {"summary": self.summary()}}
+
+    def write_chrome_trace(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.to_chrome_trace(), f, indent=1)
+
+    def write_summary(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(self.format_summary() + "\n")
+
+@contextmanager
+def trace_job(tracer):
+    token = _current_tracer.set(tracer)
+    try:
+        yield tracer
+    finally:
+        _current_tracer.reset(token)
+
+@contextmanager
+def span(**labels):
+    # Nested labels (effect=..., step=..., stage=...) attached to processes run inside
+    merged = dict(_current_span.get())
+    merged.update({k: v for k, v in labels.items() if v is not None})
+    token = _current_span.set(merged)
+    try:
+        yield
+    finally:
+        _current_span.reset(token)
+
+def _input_bytes(cmd):
+    total = 0
+    for i, arg in enumerate(cmd[:-1]):
+        if arg == "-i" and os.path.isfile(cmd[i + 1]):
+            total += os.path.getsize(cmd[i + 1])
+    if cmd and os.path.basename(cmd[0]).startswith("ffprobe") and os.path.isfile(cmd[-1]):
+        total += os.path.getsize(cmd[-1])
+    return total
+
+def _exit_code(status):
+    if hasattr(os, "waitstatus_to_exitcode"):
+        return os.waitstatus_to_exitcode(status)
+    if os.WIFSIGNALED(status):
+        return -os.WTERMSIG(status)
+    return os.WEXITSTATUS(status)
+
+def _run_with_rusage(cmd):
+    # Popen + os.wait4 so the child's own rusage is available (POSIX only)
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    if not hasattr(os, "wait4"):
+        out, err = proc.communicate()
+        return proc.returncode, out, err, None
+    chunks = {}
+    def drain(name, stream):
+        chunks[name] = stream.read()
+        stream.close()
+    readers = [threading.Thread(target=drain, args=("out", proc.stdout), daemon=True),
+               threading.Thread(target=drain, args=("err", proc.stderr), daemon=True)]
+    for t in readers:
+        t.start()
+    _, status, usage = os.wait4(proc.pid, 0)
+    proc.returncode = _exit_code(status)
+    for t in readers:
+        t.join()
+    return proc.returncode, chunks.get("out", b""), chunks.get("err", b""), usage
+
+def _record(tracer, cmd, labels, start, wall, rc, usage, in_bytes, out_bytes):
+    if cmd and cmd[-1] != "-" and os.path.isfile(cmd[-1]) and not os.path.basename(cmd[0]).startswith("ffprobe"):
+        out_bytes = os.path.getsize(cmd[-1])
+    rss = None
+    if usage is not None:
+        # ru_maxrss is KiB on Linux, bytes on macOS
+        rss = usage.ru_maxrss // 1024 if sys.platform == "darwin" else usage.ru_maxrss
+    tracer.add(TraceRecord(
+        argv=list(cmd), start=start, wall_s=wall, returncode=rc,
+        effect=labels.get("effect"), step=labels.get("step"), stage=labels.get("stage"),
+        cpu_user_s=usage.ru_utime if usage is not None else None,
+        cpu_sys_s=usage.ru_stime if usage is not None else None,
+        peak_rss_kb=rss, input_bytes=in_bytes, output_bytes=out_bytes,
+    ))
+
+def run(cmd, text=True):
+    """subprocess.run(cmd, capture, check=True) that records a TraceRecord when tracing."""
+    tracer = _current_tracer.get()
+    if tracer is None:
+        return subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=text, check=True)
+    labels = _current_span.get()
+    in_bytes = _input_bytes(cmd)
+    start = time.time()
+    t_start = time.perf_counter()
+    rc, out, err, usage = _run_with_rusage(cmd)
+    _record(tracer, cmd, labels, start, time.perf_counter() - t_start, rc, usage, in_bytes, len(out))
+    if text:
+        out = out.decode("utf-8", errors="replace")
+        err = err.decode("utf-8", errors="replace")
+    if rc != 0:
+        raise subprocess.CalledProcessError(rc, cmd, output=out, stderr=err)
+    return subprocess.CompletedProcess(cmd, rc, out, err)
+
+def _reap(proc):
+    # Kill the child if it is still running and reap it, with its rusage where available
+    if not hasattr(os, "wait4"):
+        if proc.poll() is None:
+            proc.kill()
+        proc.wait()
+        return None
+    pid, status, usage = os.wait4(proc.pid, os.WNOHANG)
+    if pid == 0:
+        proc.kill()
+        _, status, usage = os.wait4(proc.pid, 0)
+    proc.returncode = _exit_code(status)
+    return usage
+
+@contextmanager
+def stream(cmd, bufsize=-1):
+    """Popen(cmd) with stdout/stderr pipes for incremental reads.
+
+    The process is killed if still running when the block exits, and is
+    recorded like run() when tracing (the returncode is set afterwards).
+    """
+    tracer = _current_tracer.get()
+    labels = _current_span.get()
+    in_bytes = _input_bytes(cmd) if tracer is not None else 0
+    start = time.time()
+    t_start = time.perf_counter()
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, bufsize=bufsize)
+    try:
+        yield proc
+    finally:
+        usage = _reap(proc)
+        if tracer is not None:
+            _record(tracer, cmd, labels, start, time.perf_counter() - t_start, proc.returncode, usage, in_bytes, 0)
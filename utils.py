@@ -1,5 +1,48 @@
 import os
+import time
 import random
+import hashlib
+
+CACHE_ROOT = os.environ.get("YTP_CACHE_DIR") or os.path.join(os.path.expanduser("~"), ".ytpdeluxe_cache")
 
 def clamp(v, lo, hi):
-    return max(lo, min(hi, v))
\ No newline at end of file
+    return max(lo, min(hi, v))
+
+def cache_dir(name):
+    # Per-feature cache directory under CACHE_ROOT (created on demand)
+    path = os.path.join(CACHE_ROOT, name)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+def file_cache_key(path):
+    # Identify an input by absolute path + size + mtime so edits invalidate caches
+    st = os.stat(path)
+    raw = f"{os.path.abspath(path)}|{st.st_size}|{st.st_mtime_ns}"
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+def evict_lru(directory, suffix, max_bytes, keep=None, min_age=0.0):
+    # Remove the least recently used files (by mtime) until the total fits in
+    # max_bytes. Files touched within min_age seconds may be in use and stay.
+    entries = []
+    for name in os.listdir(directory):
+        if not name.endswith(suffix):
+            continue
+        path = os.path.join(directory, name)
+        try:
+            st = os.stat(path)
+        except OSError:
+            continue
+        entries.append((st.st_mtime, st.st_size, path))
+    total = sum(size for _, size, _ in entries)
+    cutoff = time.time() - min_age
+    for mtime, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        if mtime > cutoff or (keep and os.path.abspath(path) == os.path.abspath(keep)):
+            continue
+        try:
+            os.remove(path)
+            total -= size
+        except OSError:
+            pass
+    return total